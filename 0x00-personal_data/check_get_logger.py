@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""get_logger idempotence check.
+
+Calls get_logger 10,000 times and checks that the user_data logger still
+carries a single handler chain, each record being formatted and written
+once, at the same cost as after the first call. Also checks that a
+closed chain is rebuilt, and that replacing an asynchronous chain stops
+its listener thread. Exits with an error message on failure.
+
+Usage: ./check_get_logger.py [--calls 10000] [--records 2000]
+"""
+from io import StringIO
+from typing import Callable
+import argparse
+import logging
+import sys
+import threading
+import time
+
+filtered_logger = __import__('filtered_logger')
+get_logger = filtered_logger.get_logger
+RedactingFormatter = filtered_logger.RedactingFormatter
+
+MESSAGE = 'name=Bob;email=bob@dylan.com;ssn=000-123-0000;password=bobby2019;'
+# tolerated slowdown of formatting after all the calls, for timing noise
+MAX_SLOWDOWN = 2.0
+
+
+def formats_per_record(log: logging.Logger) -> int:
+    """Returns how many times one record gets formatted by @log."""
+    calls = 0
+    format_orig = RedactingFormatter.format
+
+    def format_counted(self, record):
+        nonlocal calls
+        calls += 1
+        return format_orig(self, record)
+
+    RedactingFormatter.format = format_counted
+    try:
+        log.info(MESSAGE)
+    finally:
+        RedactingFormatter.format = format_orig
+    return calls
+
+
+def seconds_per_record(log: logging.Logger, records: int) -> float:
+    """Returns the best mean time of logging one record, over 5 runs."""
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(records):
+            log.info(MESSAGE)
+        seconds = (time.perf_counter() - start) / records
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def check(condition: bool, failure: str) -> None:
+    """Exits with @failure unless @condition holds."""
+    if not condition:
+        sys.exit('FAIL: ' + failure)
+
+
+def listeners() -> int:
+    """Returns the number of running listener threads."""
+    return sum(1 for thread in threading.enumerate()
+               if thread.name.endswith('(_monitor)'))
+
+
+def main() -> None:
+    """Parses the command line and runs the checks."""
+    parser = argparse.ArgumentParser(
+            description='Check that get_logger never stacks up handlers.')
+    parser.add_argument(
+            '--calls', type=int, default=10000,
+            help='get_logger calls (default: %(default)s)')
+    parser.add_argument(
+            '--records', type=int, default=2000,
+            help='records timed per run (default: %(default)s)')
+    args = parser.parse_args()
+
+    stream = StringIO()
+    log = get_logger(stream=stream)
+    first = seconds_per_record(log, args.records)
+    for _ in range(args.calls):
+        log = get_logger(stream=stream)
+    check(len(log.handlers) == 1,
+          '{} handlers after {} calls'.format(len(log.handlers), args.calls))
+    check(formats_per_record(log) == 1, 'a record is formatted more than once')
+    stream.seek(0)
+    stream.truncate()
+    log.info(MESSAGE)
+    check(stream.getvalue().count('\n') == 1, 'a record is written twice')
+    last = seconds_per_record(log, args.records)
+    print('per record: {:.2f} us after 1 call, {:.2f} us after {} calls'
+          .format(first * 1e6, last * 1e6, args.calls), file=sys.stderr)
+    check(last <= first * MAX_SLOWDOWN, 'formatting got slower')
+
+    log.handlers[0].close()
+    log = get_logger(stream=stream)
+    stream.seek(0)
+    stream.truncate()
+    log.info(MESSAGE)
+    check(stream.getvalue().count('\n') == 1,
+          'records are lost after the sync chain was closed')
+
+    log = get_logger(stream=stream, asynchronous=True)
+    log.handlers[0].close()
+    log = get_logger(stream=stream, asynchronous=True)
+    stream.seek(0)
+    stream.truncate()
+    log.info(MESSAGE)
+    log.handlers[0].queue.join()
+    check(stream.getvalue().count('\n') == 1,
+          'records are lost after the async chain was closed')
+    check(listeners() == 1, '{} listener threads'.format(listeners()))
+
+    get_logger(stream=stream)
+    check(listeners() == 0, 'the replaced async listener still runs')
+    print('OK', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
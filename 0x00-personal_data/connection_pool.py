@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Pool of reusable database connections.
+"""
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+import threading
+import time
+import weakref
+
+
+class PooledConnection:
+    """Connection borrowed from a ConnectionPool.
+
+    Behaves like the wrapped connection, except that close() hands it back
+    to the pool instead of closing it, as does leaving a `with` block. A
+    connection garbage-collected without being closed is discarded, its
+    state being unknown, and its pool slot freed.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', connection: Any):
+        self._pool = pool
+        self._connection = connection
+        self._finalizer = weakref.finalize(self, pool.reclaim, connection)
+
+    def __getattr__(self, name: str) -> Any:
+        """Delegates everything else to the wrapped connection."""
+        if self._connection is None:
+            raise AttributeError('connection returned to its pool')
+        return getattr(self._connection, name)
+
+    def __enter__(self) -> 'PooledConnection':
+        """Borrows the connection for a `with` block."""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Returns the connection to its pool, like MySQLConnection closes."""
+        self.close()
+
+    def close(self) -> None:
+        """Returns the connection to its pool; further calls do nothing."""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._finalizer.detach()
+            self._pool.release(connection)
+
+
+class ConnectionPool:
+    """Bounded pool of connections created by @connect.
+
+    At most @size connections are borrowed at any time; acquire() waits
+    for one to be returned beyond that. Idle connections are checked when
+    borrowed, and discarded if idle for over @idle_timeout seconds or if
+    their health check fails.
+    """
+
+    def __init__(
+            self,
+            connect: Callable[[], Any],
+            size: int = 5,
+            idle_timeout: float = 300
+            ):
+        if size < 1:
+            raise ValueError('pool size must be at least 1')
+        self._connect = connect
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self._idle = deque()  # (connection, time it was released)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self, timeout: float = None) -> PooledConnection:
+        """Borrows a healthy connection, opening one if none is idle.
+
+        Raises TimeoutError if no connection frees up within @timeout
+        seconds (wait forever if None).
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError('no connection available in the pool')
+        try:
+            connection = self._take_idle()
+            if connection is None:
+                connection = self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+        return PooledConnection(self, connection)
+
+    def release(self, connection: Any) -> None:
+        """Puts a borrowed @connection back in the pool."""
+        with self._lock:
+            self._idle.append((connection, time.monotonic()))
+        self._slots.release()
+
+    def reclaim(self, connection: Any) -> None:
+        """Discards a borrowed @connection that was never returned."""
+        self._discard(connection)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout: float = None) -> Iterator[PooledConnection]:
+        """Borrows a connection for the `with` block, always returning it."""
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def _take_idle(self) -> Any:
+        """Returns the most recently used healthy idle connection, or None.
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, released_at = self._idle.pop()
+            idle_for = time.monotonic() - released_at
+            if idle_for <= self.idle_timeout and self._is_healthy(connection):
+                return connection
+            self._discard(connection)
+
+    @staticmethod
+    def _is_healthy(connection: Any) -> bool:
+        """Checks @connection with its is_connected() method, if any."""
+        is_connected = getattr(connection, 'is_connected', None)
+        if is_connected is None:
+            return True
+        try:
+            return bool(is_connected())
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(connection: Any) -> None:
+        """Closes @connection, ignoring errors from a dead one."""
+        try:
+            connection.close()
+        except Exception:
+            pass
@@ -1,7 +1,194 @@
 #!/usr/bin/env python3
 """Encrypt passwords with bcrypt.
 """
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
 import bcrypt
+import os
+import threading
+import time
+
+# seconds one hash should take; the bcrypt cost is calibrated to it
+TARGET_LATENCY = float(os.getenv('PERSONAL_DATA_HASH_LATENCY', '0.25'))
+# threads hashing concurrently; bcrypt releases the GIL while hashing
+HASH_WORKERS = int(os.getenv('PERSONAL_DATA_HASH_WORKERS', '0')) or None
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def calibrate_rounds(
+        target_latency: float,
+        min_rounds: int = 10,
+        max_rounds: int = 16
+        ) -> int:
+    """Returns the highest bcrypt cost whose hash fits in @target_latency.
+
+    Each extra round doubles the work, so a single hash timed at
+    @min_rounds is enough to extrapolate the others. The result is kept
+    within [@min_rounds, @max_rounds].
+    """
+    start = time.perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(min_rounds))
+    elapsed = time.perf_counter() - start
+
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed * 2 <= target_latency:
+        elapsed *= 2
+        rounds += 1
+    return rounds
+
+
+class HashingService:
+    """Hashes and verifies passwords with bcrypt on a bounded thread pool.
+
+    The cost factor is @rounds, or calibrated to @target_latency when not
+    given. At most @workers hashes run at once. The latency of the last
+    @samples hashes and verifications is kept for percentiles().
+    """
+
+    OPERATIONS = ('hash', 'verify')
+
+    def __init__(
+            self,
+            target_latency: float = TARGET_LATENCY,
+            workers: int = HASH_WORKERS,
+            rounds: int = None,
+            samples: int = 1000
+            ):
+        if rounds is None:
+            rounds = calibrate_rounds(target_latency)
+        self.rounds = rounds
+        self._executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='bcrypt')
+        self._latencies = {
+                operation: deque(maxlen=samples)
+                for operation in self.OPERATIONS
+                }
+
+    def _timed(self, operation: str, func, *args):
+        """Calls @func with @args, recording its latency for @operation."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            # deque.append is thread-safe
+            self._latencies[operation].append(time.perf_counter() - start)
+
+    def _hash(self, password: str) -> bytes:
+        """Hashes @password on the calling thread."""
+        return self._timed(
+                'hash', bcrypt.hashpw,
+                password.encode(), bcrypt.gensalt(self.rounds))
+
+    def _verify(self, hashed_password: bytes, password: str) -> bool:
+        """Checks @password against @hashed_password on the calling thread.
+        """
+        return self._timed(
+                'verify', bcrypt.checkpw, password.encode(), hashed_password)
+
+    def hash(self, password: str) -> bytes:
+        """Returns a salted, hashed password from @password."""
+        return self._executor.submit(self._hash, password).result()
+
+    def verify(self, hashed_password: bytes, password: str) -> bool:
+        """Checks if @hashed_password is the hash of @password."""
+        return self._executor.submit(
+                self._verify, hashed_password, password).result()
+
+    def hash_many(self, passwords: Iterable[str]) -> List[bytes]:
+        """Returns the hashes of @passwords, computed across the pool."""
+        return list(self._executor.map(self._hash, passwords))
+
+    def verify_many(
+            self,
+            credentials: Iterable[Tuple[bytes, str]]
+            ) -> List[bool]:
+        """Checks each (hashed_password, password) pair of @credentials.
+
+        Returns:
+            list: one bool per pair, in the order of @credentials.
+        """
+        return list(self._executor.map(
+            lambda pair: self._verify(*pair), credentials))
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        """Checks if @hashed_password uses a lower cost than the policy.
+
+        Hashes whose cost cannot be read are reported as well.
+        """
+        try:
+            # bcrypt hashes look like b'$2b$<cost>$<salt and digest>'
+            return int(hashed_password.split(b'$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def verify_and_rehash(
+            self,
+            hashed_password: bytes,
+            password: str
+            ) -> Tuple[bool, Optional[bytes]]:
+        """Checks @password, rehashing it if its hash is below the policy.
+
+        Returns:
+            tuple: whether @password is valid, and its new hash when the
+            caller should store one (None otherwise).
+        """
+        if not self.verify(hashed_password, password):
+            return (False, None)
+        if not self.needs_rehash(hashed_password):
+            return (True, None)
+        return (True, self.hash(password))
+
+    async def ahash(self, password: str) -> bytes:
+        """Coroutine version of hash()."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._hash, password)
+
+    async def averify(self, hashed_password: bytes, password: str) -> bool:
+        """Coroutine version of verify()."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+                self._executor, self._verify, hashed_password, password)
+
+    def percentiles(
+            self,
+            operation: str = 'hash',
+            points: Sequence[float] = (50, 90, 99)
+            ) -> Dict[float, float]:
+        """Returns the latency percentiles, in seconds, of @operation.
+
+        Args:
+            operation (str): 'hash' or 'verify'.
+            points (Sequence[float]): the percentiles to report.
+
+        Returns:
+            dict: maps each of @points to its latency (nearest rank);
+            empty if nothing was measured yet.
+        """
+        latencies = sorted(self._latencies[operation])
+        if not latencies:
+            return {}
+        last = len(latencies) - 1
+        return {
+                point: latencies[min(last, int(point / 100 * len(latencies)))]
+                for point in points
+                }
+
+    def shutdown(self) -> None:
+        """Waits for pending hashes and stops the worker threads."""
+        self._executor.shutdown(wait=True)
+
+
+def get_service() -> HashingService:
+    """Returns the shared HashingService, calibrating it on first use."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = HashingService()
+        return _service
 
 
 def hash_password(password: str) -> bytes:
@@ -13,10 +200,42 @@ def hash_password(password: str) -> bytes:
     Returns:
         bytes: a bytes string representing the hash.
     """
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+    return get_service().hash(password)
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
     """Checks if @hashed_password is the hash of @password.
     """
-    return bcrypt.checkpw(password.encode(), hashed_password)
+    return get_service().verify(hashed_password, password)
+
+
+def hash_passwords(passwords: Iterable[str]) -> List[bytes]:
+    """Returns the salted hashes of @passwords, hashed in parallel.
+    """
+    return get_service().hash_many(passwords)
+
+
+def are_valid(credentials: Iterable[Tuple[bytes, str]]) -> List[bool]:
+    """Checks each (hashed_password, password) pair, in parallel.
+    """
+    return get_service().verify_many(credentials)
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """Checks if @hashed_password uses a lower cost than the current policy.
+    """
+    return get_service().needs_rehash(hashed_password)
+
+
+def is_valid_and_rehash(
+        hashed_password: bytes,
+        password: str
+        ) -> Tuple[bool, Optional[bytes]]:
+    """Checks if @hashed_password is the hash of @password, like is_valid.
+
+    Returns:
+        tuple: the result of the check, and a new hash of @password to
+        store in place of @hashed_password when the latter's cost is below
+        the current policy (None otherwise).
+    """
+    return get_service().verify_and_rehash(hashed_password, password)
@@ -1,14 +1,86 @@
 #!/usr/bin/env python3
 """Redact logs with regex.
 """
-from typing import List, Sequence
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from connection_pool import ConnectionPool, PooledConnection
+from contextlib import closing
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from queue import Empty, Full, Queue
+from typing import (
+        ContextManager, Iterable, Iterator, List, Mapping, Pattern, Sequence,
+        TextIO, Tuple
+        )
+import argparse
+import copy
+import json
 import logging
 import re
+import sys
+import threading
 import mysql.connector
 import os
 
-pr = r'(.*{}?{}=).*?(;.*)'  # field regex
-r = r'\1{}\2'  # replacement
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def dumps_json(data: Mapping) -> str:
+        """Serializes @data to a compact JSON string with orjson."""
+        return orjson.dumps(
+                data, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+else:
+    def dumps_json(data: Mapping) -> str:
+        """Serializes @data to a compact JSON string."""
+        return json.dumps(data, default=str, separators=(',', ':'))
+
+
+@lru_cache(maxsize=32)
+def _redactor(
+        fields: Tuple[str, ...],
+        redaction: str,
+        separator: str
+        ) -> Tuple[Pattern, str]:
+    """Returns the compiled pattern and replacement template for a field set.
+
+    All fields are folded into one alternation, so that a message is
+    redacted in a single left-to-right pass instead of once per field.
+    A field only matches at the start of the message or right after
+    @separator, and its value runs up to the next @separator.
+    """
+    sep = re.escape(separator)
+    alternation = '|'.join(re.escape(field) for field in fields)
+    if len(separator) == 1:
+        # a character class scan is much cheaper than a lazy lookahead
+        fmt = r'(?<![^{0}])({1})=[^{0}]*(?={0})'
+    else:
+        fmt = r'(?:^|(?<={0}))({1})=.*?(?={0})'
+    pattern = re.compile(fmt.format(sep, alternation))
+    # escape backslashes so the redaction is never read as a group reference
+    template = r'\g<1>=' + redaction.replace('\\', r'\\')
+    return pattern, template
+
+
+def redact_mapping(
+        fields: Sequence[str],
+        redaction: str,
+        mapping: Mapping
+        ) -> Mapping:
+    """Returns @mapping with the values of @fields replaced by @redaction.
+
+    @mapping is returned as is when it holds none of @fields, and is
+    otherwise shallow-copied; it is never modified.
+    """
+    present = [field for field in fields if field in mapping]
+    if not present:
+        return mapping
+    redacted = dict(mapping)
+    for field in present:
+        redacted[field] = redaction
+    return redacted
 
 
 def filter_datum(
@@ -18,53 +90,59 @@ def filter_datum(
         separator: str
         ) -> str:
     """Returns the log `message` obfuscated."""
-    rdt = message
-    for field in fields:
-        rdt = re.sub(pr.format(separator, field), r.format(redaction), rdt)
-    return rdt
+    if not fields:
+        return message
+    pattern, template = _redactor(tuple(fields), redaction, separator)
+    return pattern.sub(template, message)
 
 
-def get_logger() -> logging.Logger:
-    """Returns the `user_data` logger.
-    """
-    # create logger, or retrieve if previously created
-    logger = logging.getLogger('user_data')  # returns same logger next time
+# number of rows fetched from the database per round trip
+BATCH_SIZE = int(os.getenv('PERSONAL_DATA_BATCH_SIZE', '1000'))
+# connections kept by get_db, and seconds before an idle one is dropped
+POOL_SIZE = int(os.getenv('PERSONAL_DATA_DB_POOL_SIZE', '5'))
+POOL_IDLE_TIMEOUT = float(os.getenv('PERSONAL_DATA_DB_IDLE_TIMEOUT', '300'))
+# seconds get_db waits for a connection once all of them are borrowed
+POOL_TIMEOUT = float(os.getenv('PERSONAL_DATA_DB_POOL_TIMEOUT', '30'))
 
-    # set log level
-    logger.setLevel(logging.INFO)
+_pool = None
+_pool_lock = threading.Lock()
 
-    # prevent propagation of messages to parent loggers
-    logger.propagate = False
-
-    # create handler for logger
-    handler = logging.StreamHandler()  # logs to console
-    # create formatter for handler
-    formatter = RedactingFormatter(PII_FIELDS)
-    handler.setFormatter(formatter)
 
-    # attach handler to logger
-    logger.addHandler(handler)
+def connect_db() -> mysql.connector.connection.MySQLConnection:
+    """Opens a new connection to the database.
 
-    return logger
+    Credentials are read from the environment on each call.
+    """
+    return mysql.connector.connection.MySQLConnection(
+            host=os.getenv('PERSONAL_DATA_DB_HOST'),
+            user=os.getenv('PERSONAL_DATA_DB_USERNAME'),
+            password=os.getenv('PERSONAL_DATA_DB_PASSWORD'),
+            database=os.getenv('PERSONAL_DATA_DB_NAME'),
+            )
 
 
-# retrieve database credentials
-user = os.getenv('PERSONAL_DATA_DB_USERNAME')
-pwd = os.getenv('PERSONAL_DATA_DB_PASSWORD')
-host = os.getenv('PERSONAL_DATA_DB_HOST')
-db = os.getenv('PERSONAL_DATA_DB_NAME')
+def get_pool() -> ConnectionPool:
+    """Returns the connection pool behind get_db, creating it once."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(connect_db, POOL_SIZE, POOL_IDLE_TIMEOUT)
+        return _pool
 
 
-def get_db() -> mysql.connector.connection.MySQLConnection:
+def get_db() -> PooledConnection:
     """Returns a connector to a database.
+
+    The connector is borrowed from the pool; closing it, or leaving a
+    `with` block on it, returns it there. Raises TimeoutError if none
+    frees up within POOL_TIMEOUT seconds.
     """
-    connector = mysql.connector.connection.MySQLConnection(
-            host=host,
-            user=user,
-            password=pwd,
-            database=db,
-            )
-    return connector
+    return get_pool().acquire(POOL_TIMEOUT)
+
+
+def db_connection() -> ContextManager[PooledConnection]:
+    """Borrows a connector for a `with` block, always returning it."""
+    return get_pool().connection(POOL_TIMEOUT)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -75,55 +153,409 @@ class RedactingFormatter(logging.Formatter):
     FORMAT = "[HOLBERTON] %(name)s %(levelname)s %(asctime)-15s: %(message)s"
     SEPARATOR = ";"
 
-    def __init__(self, fields: List[str]):
+    def __init__(self, fields: List[str], separator: str = SEPARATOR):
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self.separator = separator
 
     def format(self, record: logging.LogRecord) -> str:
-        """ Filters message, formats and returns the formated string."""
+        """ Filters message, formats and returns the formated string.
+
+        A record whose message is a mapping is formatted by format_json
+        instead. @record itself is left untouched.
+        """
         msg = record.msg
-        f_msg = filter_datum(self.fields, self.REDACTION, msg, self.SEPARATOR)
+        if isinstance(msg, Mapping):
+            return self.format_json(record)
+        f_msg = filter_datum(self.fields, self.REDACTION, msg, self.separator)
+        # format a copy, so that other handlers still get the original
+        record = copy.copy(record)
         record.msg = f_msg
         return super().format(record)
 
+    def format_json(self, record: logging.LogRecord) -> str:
+        """ Returns a JSON line for a record whose message is a mapping.
+
+        The mapping is redacted by key lookup, without any regex scan, and
+        is only copied if it holds one of the fields.
+        """
+        data = {
+                'name': record.name,
+                'levelname': record.levelname,
+                'asctime': self.formatTime(record, self.datefmt),
+                'message': redact_mapping(
+                    self.fields, self.REDACTION, record.msg),
+                }
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return dumps_json(data)
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """StreamHandler that leaves flushing to its caller.
+
+    Used behind a BatchingQueueListener, which flushes once per batch
+    instead of once per record.
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Writes the formatted @record to the stream without flushing."""
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class BatchingQueueListener(QueueListener):
+    """QueueListener that handles records in batches.
+
+    After each batch of up to `batch_size` records, the handlers are
+    flushed once.
+    """
+
+    def __init__(self, queue: Queue, *handlers, batch_size: int = 100):
+        super().__init__(queue, *handlers)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self) -> None:
+        """Enqueues the stop sentinel, waiting for room in a full queue."""
+        self.queue.put(self._sentinel)
+
+    def _monitor(self) -> None:
+        """Handles queued records until the sentinel is dequeued."""
+        q = self.queue
+        while True:
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except Empty:
+                    break
+
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                q.task_done()
+            for handler in self.handlers:
+                handler.flush()
+            if stop:
+                return
+
+
+class AsyncRedactingHandler(QueueHandler):
+    """Enqueues records for @handler, which runs on a listener thread.
+
+    The queue holds at most @queue_size records. Once it is full, @policy
+    decides what happens to a new record:
+        - 'block': the caller waits for room.
+        - 'drop-oldest': the oldest queued record is discarded.
+        - 'drop-newest': the new record is discarded.
+    """
+
+    POLICIES = ('block', 'drop-oldest', 'drop-newest')
+
+    def __init__(
+            self,
+            handler: logging.Handler,
+            queue_size: int = 10000,
+            policy: str = 'block',
+            batch_size: int = 100
+            ):
+        if policy not in self.POLICIES:
+            raise ValueError('unknown backpressure policy: {}'.format(policy))
+        super().__init__(Queue(queue_size))
+        self.policy = policy
+        self.dropped = 0  # records discarded by the policy
+        self.listener = BatchingQueueListener(
+                self.queue, handler, batch_size=batch_size)
+        self.listener.start()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of records waiting for the listener."""
+        return self.queue.qsize()
+
+    def stats(self) -> dict:
+        """Returns the queue depth and dropped records counters."""
+        return {'queue_depth': self.queue_depth, 'dropped': self.dropped}
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Returns a copy of @record with its arguments merged.
+
+        Unlike QueueHandler.prepare, the record is not formatted here, so
+        that redaction is left to the listener thread.
+        """
+        record = copy.copy(record)
+        if record.args:
+            # mapping messages without arguments are kept as they are
+            record.msg = record.getMessage()
+            record.args = None
+        return record
 
-def main() -> None:
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Enqueues @record, applying the backpressure policy if full.
+
+        Runs under the handler lock, so the counters need no other one.
+        """
+        if self.policy == 'block':
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except Full:
+                if self.policy == 'drop-newest':
+                    self.dropped += 1
+                    return
+            try:
+                self.queue.get_nowait()  # drop-oldest
+                self.queue.task_done()
+                self.dropped += 1
+            except Empty:
+                pass
+
+    @property
+    def closed(self) -> bool:
+        """Whether the listener thread is stopped, records being lost."""
+        return self.listener._thread is None
+
+    def close(self) -> None:
+        """Drains the queue and stops the listener thread."""
+        self.acquire()
+        try:
+            if self.listener._thread is not None:
+                self.listener.stop()
+        finally:
+            self.release()
+        super().close()
+
+
+# handler chains built by get_logger, keyed on their configuration
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def get_logger(
+        fields: Sequence[str] = None,
+        separator: str = RedactingFormatter.SEPARATOR,
+        stream: TextIO = None,
+        asynchronous: bool = False,
+        queue_size: int = 10000,
+        policy: str = 'block',
+        batch_size: int = 100
+        ) -> logging.Logger:
+    """Returns the `user_data` logger.
+
+    Records are redacted for @fields (PII_FIELDS by default) split by
+    @separator and written to @stream (stderr by default).
+
+    With @asynchronous, records go through an AsyncRedactingHandler: the
+    caller only pays to enqueue them on a queue of @queue_size records,
+    handled according to @policy once full, while redaction and writing
+    happen on a listener thread, @batch_size records per flush.
+
+    The handler chain is built once per configuration and cached, so
+    calling this again never stacks up duplicate handlers; the logger
+    always carries the chain of the latest configuration asked for.
+    A cached chain that was closed since (e.g. by logging.shutdown) is
+    rebuilt, and an asynchronous chain replaced by another configuration
+    is closed, stopping its listener thread.
+    """
+    if fields is None:
+        fields = PII_FIELDS
+    if stream is None:
+        stream = sys.stderr
+    key = (tuple(fields), separator, stream,
+           asynchronous, queue_size, policy, batch_size)
+
+    # create logger, or retrieve if previously created
+    logger = logging.getLogger('user_data')  # returns same logger next time
+
+    with _handlers_lock:
+        handler = _handlers.get(key)
+        if handler is None or _is_closed(handler):
+            if handler is not None:
+                logger.removeHandler(handler)
+            handler = _handlers[key] = _build_handler(*key)
+
+        # set log level
+        logger.setLevel(logging.INFO)
+
+        # prevent propagation of messages to parent loggers
+        logger.propagate = False
+
+        # detach chains of other configurations, then attach this one
+        for other_key, other in list(_handlers.items()):
+            if other is handler:
+                continue
+            logger.removeHandler(other)
+            if isinstance(other, AsyncRedactingHandler):
+                # its listener thread would otherwise run forever
+                del _handlers[other_key]
+                other.close()
+        if handler not in logger.handlers:
+            logger.addHandler(handler)
+
+    return logger
+
+
+def _is_closed(handler: logging.Handler) -> bool:
+    """Checks if a cached handler chain can no longer emit records."""
+    if isinstance(handler, AsyncRedactingHandler) and handler.closed:
+        return True
+    return getattr(handler, '_closed', False)
+
+
+def _build_handler(
+        fields: Tuple[str, ...],
+        separator: str,
+        stream: TextIO,
+        asynchronous: bool,
+        queue_size: int,
+        policy: str,
+        batch_size: int
+        ) -> logging.Handler:
+    """Returns a new handler chain for get_logger's configuration."""
+    # create handler for logger
+    if asynchronous:
+        # writes are flushed once per batch by the listener
+        handler = BufferedStreamHandler(stream)
+    else:
+        handler = logging.StreamHandler(stream)  # logs to console
+    # create formatter for handler
+    formatter = RedactingFormatter(list(fields), separator)
+    handler.setFormatter(formatter)
+
+    if asynchronous:
+        handler = AsyncRedactingHandler(
+                handler, queue_size, policy, batch_size)
+    return handler
+
+
+def stream_batches(cursor, batch_size: int) -> Iterator[List[Sequence]]:
+    """Yields the rows of an executed @cursor in lists of @batch_size rows.
+
+    Only one batch is ever held in memory, however big the result set is.
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def stream_rows(cursor, batch_size: int) -> Iterator[Sequence]:
+    """Yields the rows of an executed @cursor, fetching @batch_size at a time.
+    """
+    for rows in stream_batches(cursor, batch_size):
+        yield from rows
+
+
+def row_messages(
+        fields: Sequence[str],
+        rows: Iterable[Sequence]
+        ) -> Iterator[str]:
+    """Lazily maps each row in @rows to a `field=value;...` log message."""
+    for row in rows:
+        yield ";".join(
+                "{}={}".format(field, value)
+                for field, value in zip(fields, row)
+                )
+
+
+def format_batch(fields: Sequence[str], rows: List[Sequence]) -> List[str]:
+    """Returns the redacted, formatted log lines of a batch of @rows.
+
+    Runs in the export worker processes, applying the same rules as the
+    `user_data` logger's RedactingFormatter.
+    """
+    formatter = RedactingFormatter(PII_FIELDS)
+    lines = []
+    for msg in row_messages(fields, rows):
+        record = logging.LogRecord(
+                'user_data', logging.INFO, __file__, 0, msg, None, None)
+        lines.append(formatter.format(record))
+    return lines
+
+
+def export_parallel(
+        cursor,
+        fields: Sequence[str],
+        workers: int,
+        batch_size: int,
+        stream: TextIO = None
+        ) -> None:
+    """Formats the rows of @cursor on a pool of @workers processes.
+
+    Batches are handed out in order and their lines written to @stream
+    (stderr by default, like the logger) in that same order. At most two
+    batches per worker are in flight, so memory stays bounded.
+    """
+    if stream is None:
+        stream = sys.stderr
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows in stream_batches(cursor, batch_size):
+            pending.append(pool.submit(format_batch, fields, rows))
+            if len(pending) >= 2 * workers:
+                # oldest batch first keeps the output in row order
+                stream.write('\n'.join(pending.popleft().result()) + '\n')
+        while pending:
+            stream.write('\n'.join(pending.popleft().result()) + '\n')
+    stream.flush()
+
+
+def main(
+        connector=None,
+        batch_size: int = BATCH_SIZE,
+        workers: int = 1
+        ) -> None:
     """Retrieve rows from the database and log using the custom formatter.
+
+    Rows are streamed through an unbuffered cursor in batches of
+    @batch_size, so memory stays flat however large the `users` table is.
+    With more than one of @workers, batches are redacted in parallel by
+    export_parallel. Any DB-API connection (e.g. sqlite3) may be passed
+    as @connector.
     """
-    # get `my_db` database connector
-    # TODO: close connection
-    connector = get_db()
-
-    # get a cursor
-    # TODO: close cursor
-    cursor = connector.cursor()
-
-    # retrieve all rows from users table
-    cursor.execute('SELECT * FROM users')  # result stored in cursor; iterable
-    rows_list = cursor.fetchall()  # list of rows of the result set
-    fields_tuple = cursor.column_names
-
-    # get logger
-    logger = get_logger()
-
-    # logging time
-    for row in rows_list:
-        msg_list = []
-        # take each row...
-        for field, value in zip(fields_tuple, row):
-            # ...and map to its field to create a log message field/unit
-            msg_field = "{}={}".format(field, value)
-            msg_list.append(msg_field)
-        # join all message fields into the actual message
-        msg = ";".join(msg_list)
-        # log message
-        logger.info(msg)
-
-    cursor.close()  # DONE: close cursor
-    connector.close()  # DONE: close connection
+    if connector is None:
+        # borrow a `my_db` database connector from the pool
+        connection = db_connection()
+    else:
+        connection = closing(connector)
+
+    # get a cursor; unbuffered, so rows stay on the server until fetched
+    with connection as connector, closing(connector.cursor()) as cursor:
+        cursor.execute('SELECT * FROM users')
+        # first item of each column description is the column name
+        fields = [column[0] for column in cursor.description]
+
+        if workers > 1:
+            export_parallel(cursor, fields, workers, batch_size)
+            return
+
+        logger = get_logger()
+        rows = stream_rows(cursor, batch_size)
+        for msg in row_messages(fields, rows):
+            logger.info(msg)
 
 
 PII_FIELDS = ('name', 'email', 'phone', 'ssn', 'password')
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(
+            description='Log the users table with PII redacted.')
+    parser.add_argument(
+            '--workers', type=int, default=1,
+            help='number of redaction processes (default: 1)')
+    parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='rows fetched per round trip (default: %(default)s)')
+    args = parser.parse_args()
+    main(batch_size=args.batch_size, workers=args.workers)
@@ -22,6 +22,22 @@ elif auth_type == 'basic_auth':
     from api.v1.auth.basic_auth import BasicAuth
     auth = BasicAuth()
 
+# paths not requiring authentication, compiled once; a path ending with
+# '*' excludes every path it is a prefix of. More paths can be given in
+# AUTH_EXCLUDED_PATHS, separated by commas.
+excluded_paths = None
+if auth is not None:
+    from api.v1.auth.auth import PathMatcher
+    excluded_paths = PathMatcher([
+            '/api/v1/status/',
+            '/api/v1/unauthorized/',
+            '/api/v1/forbidden/',
+            ] + [
+            path.strip()
+            for path in os.getenv('AUTH_EXCLUDED_PATHS', '').split(',')
+            if path.strip()
+            ])
+
 
 @app.errorhandler(404)
 def not_found(error) -> str:
@@ -52,11 +68,6 @@ def before_request():
         return
 
     # otherwise auth is an instance of Auth
-    excluded_paths = [
-            '/api/v1/status/',
-            '/api/v1/unauthorized/',
-            '/api/v1/forbidden/',
-            ]
     if not auth.require_auth(request.path, excluded_paths):
         # authentication not required for path; do nothing
         return
@@ -2,34 +2,73 @@
 """Authentication base class.
 """
 from flask import request
-from typing import List, TypeVar
+from typing import Iterable, List, TypeVar, Union
+
+
+class PathMatcher:
+    """Set of paths, compiled for lookups in O(path length).
+
+    Paths ending with '*' match every path starting with what precedes
+    the '*'; they are kept in a prefix trie. Other paths must match
+    exactly, with a trailing slash.
+    """
+    # key of the trie nodes ending a prefix
+    END = ''
+
+    def __init__(self, paths: Iterable[str]):
+        """Compiles paths.
+        """
+        self.exact = set()
+        self.prefixes = {}
+        for path in paths:
+            if '*' in path:
+                node = self.prefixes
+                for char in path.split('*')[0]:
+                    node = node.setdefault(char, {})
+                node[self.END] = True
+            else:
+                self.exact.add(path if path.endswith('/') else path + '/')
+
+    def __bool__(self) -> bool:
+        """Returns False if there are no paths."""
+        return bool(self.exact or self.prefixes)
+
+    def matches(self, path: str) -> bool:
+        """Returns True if path is one of the paths or starts with one of
+        the prefixes.
+        """
+        s_path = (path + '/') if not path.endswith('/') else path
+        if s_path in self.exact:
+            return True
+        node = self.prefixes
+        for char in s_path:
+            if self.END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self.END in node
 
 
 class Auth:
     """Abstract class for authentication.
     """
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(
+            self,
+            path: str,
+            excluded_paths: Union[List[str], PathMatcher]
+            ) -> bool:
         """Returns True if path is not in excluded_paths; Flase otherwise.
-        """
-        if path is None or not excluded_paths:
-            return True
 
-        # it's assumed excluded_paths has strings ending with slash
-        # ensure path ends with a slash always
-        s_path = (path + '/') if not path.endswith('/') else path
+        excluded_paths is best compiled once into a PathMatcher; paths
+        ending with '*' exclude every path they are a prefix of.
         """
-        if s_path not in excluded_paths:
+        if path is None or not excluded_paths:
             return True
-        """
 
-        for excluded_path in excluded_paths:
-            if '*' in excluded_path:
-                start = excluded_path.split('*')[0]
-                if s_path.startswith(start):
-                    return False
-            if s_path == excluded_path:
-                return False
-        return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = PathMatcher(excluded_paths)
+        return not excluded_paths.matches(path)
 
     def authorization_header(self, request=None) -> str:
         """Returns a string.
@@ -2,14 +2,97 @@
 """Basic authentication module.
 """
 from api.v1.auth.auth import Auth
+from collections import OrderedDict
 from models.user import User
 from typing import TypeVar
 import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+# seconds a verified Authorization header is trusted without checking
+# the password again; 0 disables the cache
+CREDENTIAL_CACHE_TTL = float(os.getenv('BASIC_AUTH_CACHE_TTL', '60'))
+# most verified Authorization headers remembered
+CREDENTIAL_CACHE_SIZE = int(os.getenv('BASIC_AUTH_CACHE_SIZE', '10000'))
+
+
+class CredentialCache:
+    """Bounded cache of recently verified Authorization headers.
+
+    Headers are only kept as an HMAC under a key drawn for this process,
+    and map to the ID of their user with the password hash they were
+    verified against. An entry is dropped once older than ttl seconds,
+    when the least recently used of over size entries, or when its user
+    is removed or changes password.
+    """
+    def __init__(
+            self,
+            size: int = CREDENTIAL_CACHE_SIZE,
+            ttl: float = CREDENTIAL_CACHE_TTL
+            ):
+        """Initializes an empty cache.
+        """
+        self.size = size
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        # digest: (user ID, password hash, expiry time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, authorization_header: str) -> bytes:
+        """Returns the keyed digest of an Authorization header.
+        """
+        return hmac.new(self._key, authorization_header.encode(),
+                        hashlib.sha256).digest()
+
+    def get(self, authorization_header: str) -> TypeVar('User'):
+        """Returns the User verified for an Authorization header, or None.
+        """
+        if self.size <= 0 or self.ttl <= 0:
+            return None
+        digest = self._digest(authorization_header)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+
+        user = User.get(entry[0])
+        if user is None or user.password != entry[1]:
+            # removed, or the password changed since
+            with self._lock:
+                self._entries.pop(digest, None)
+            return None
+        return user
+
+    def put(self, authorization_header: str, user: TypeVar('User')):
+        """Remembers that an Authorization header verifies for user.
+        """
+        if self.size <= 0 or self.ttl <= 0:
+            return
+        digest = self._digest(authorization_header)
+        entry = (user.id, user.password, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
 
 
 class BasicAuth(Auth):
     """Basic authentication implementation.
     """
+    def __init__(self):
+        """Initializes the verified credential cache.
+        """
+        self.credential_cache = CredentialCache()
+
     def extract_base64_authorization_header(
             self,
             authorization_header: str,
@@ -88,7 +171,6 @@ class BasicAuth(Auth):
 
         # get the list of User objects matching the email
         attr = {'email': user_email}
-        user_init = User()  # init the DATA dict if not yet
         user_list = User.search(attr)
 
         user = None
@@ -106,6 +188,12 @@ class BasicAuth(Auth):
         # should not be None as before_request filters that out
         auth_header = self.authorization_header(request)
 
+        # skip the checks below for recently verified credentials
+        if type(auth_header) is str:
+            user = self.credential_cache.get(auth_header)
+            if user is not None:
+                return user
+
         # extract the base64 credentials
         base64_enc = self.extract_base64_authorization_header(auth_header)
         if base64_enc is None:
@@ -125,5 +213,7 @@ class BasicAuth(Auth):
         email = credentials_tuple[0]
         pwd = credentials_tuple[1]
         user = self.user_object_from_credentials(email, pwd)
+        if user is not None:
+            self.credential_cache.put(auth_header, user)
 
         return user
@@ -2,18 +2,84 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import abort, current_app, json, jsonify, request, url_for
+from flask import stream_with_context
 from models.user import User
+from typing import Iterator
+
+# last GET /api/v1/users response: (User.version() it was built at, body,
+# mimetype)
+all_users_cache = None
+# User objects read at once by a streamed GET /api/v1/users
+STREAM_BATCH = 1000
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of User objects returned
+      - after: ID of the User object to start after
+      - stream: 1 to send the list as the User objects are read
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented; in ID order with
+        limit or after, with a Link header to the next page if full
+      - 400 if limit isn't a positive integer
     """
+    global all_users_cache
+    after = request.args.get('after')
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    if request.args.get('stream') == '1':
+        return current_app.response_class(
+                stream_with_context(stream_users(after, limit)),
+                mimetype='application/json')
+
+    if after is not None or limit is not None:
+        users = User.page(after, limit)
+        response = jsonify([user.to_json() for user in users])
+        if limit is not None and len(users) == limit:
+            response.headers['Link'] = '<{}>; rel="next"'.format(url_for(
+                'app_views.view_all_users', after=users[-1].id, limit=limit))
+        return response
+
+    version = User.version()
+    cached = all_users_cache
+    if cached is not None and cached[0] == version:
+        return current_app.response_class(cached[1], mimetype=cached[2])
+
     all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    response = jsonify(all_users)
+    # a change made meanwhile only makes the next request rebuild it
+    all_users_cache = (version, response.get_data(), response.mimetype)
+    return response
+
+
+def stream_users(after: str = None, limit: int = None) -> Iterator[str]:
+    """ Generate, by chunks, the JSON list of the User objects in ID
+    order after the ID after, limit at most
+    """
+    yield "["
+    separator = ""
+    while limit is None or limit > 0:
+        batch = STREAM_BATCH if limit is None else min(limit, STREAM_BATCH)
+        users = User.page(after, batch)
+        if users:
+            yield separator + ",".join(
+                    json.dumps(user.to_json()) for user in users)
+            separator = ","
+        if len(users) < batch:
+            break
+        after = users[-1].id
+        if limit is not None:
+            limit -= len(users)
+    yield "]\n"
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -120,3 +186,114 @@ def update_user(user_id: str = None) -> str:
         user.last_name = rj.get('last_name')
     user.save()
     return jsonify(user.to_json()), 200
+
+
+def get_json_list() -> list:
+    """ Return the JSON list body of the request, or None
+    """
+    try:
+        rj = request.get_json()
+    except Exception as e:
+        rj = None
+    if type(rj) is not list:
+        return None
+    return rj
+
+
+@app_views.route('/users/bulk', methods=['POST'], strict_slashes=False)
+def create_users() -> str:
+    """ POST /api/v1/users/bulk
+    JSON body:
+      - list of objects with:
+        - email
+        - password
+        - last_name (optional)
+        - first_name (optional)
+    Return:
+      - list of the User objects JSON represented, all saved at once
+      - 400 if can't create one of the new Users (none is created)
+    """
+    rj = get_json_list()
+    if rj is None:
+        return jsonify({'error': "Wrong format"}), 400
+    users = []
+    for i, item in enumerate(rj):
+        error_msg = None
+        if type(item) is not dict:
+            error_msg = "Wrong format"
+        elif item.get("email", "") == "":
+            error_msg = "email missing"
+        elif item.get("password", "") == "":
+            error_msg = "password missing"
+        if error_msg is not None:
+            return jsonify({'error': "{} (item {})".format(error_msg, i)}), 400
+        user = User()
+        user.email = item.get("email")
+        user.first_name = item.get("first_name")
+        user.last_name = item.get("last_name")
+        users.append(user)
+    # hashed in parallel, not one user after the other
+    User.set_passwords(users, [item.get("password") for item in rj])
+    try:
+        User.save_many(users)
+    except Exception as e:
+        error_msg = "Can't create Users: {}".format(e)
+        return jsonify({'error': error_msg}), 400
+    return jsonify([user.to_json() for user in users]), 201
+
+
+@app_views.route('/users/bulk', methods=['PUT'], strict_slashes=False)
+def update_users() -> str:
+    """ PUT /api/v1/users/bulk
+    JSON body:
+      - list of objects with:
+        - id
+        - last_name (optional)
+        - first_name (optional)
+    Return:
+      - list of the User objects JSON represented, all saved at once
+      - 404 if one of the User IDs doesn't exist (none is updated)
+      - 400 if can't update the Users
+    """
+    rj = get_json_list()
+    if rj is None:
+        return jsonify({'error': "Wrong format"}), 400
+    users = []
+    for i, item in enumerate(rj):
+        if type(item) is not dict:
+            return jsonify({'error': "Wrong format (item {})".format(i)}), 400
+        user_id = item.get('id')
+        user = User.get(user_id) if type(user_id) is str else None
+        if user is None:
+            abort(404)
+        users.append(user)
+    # only change the Users once they are all found
+    for user, item in zip(users, rj):
+        if item.get('first_name') is not None:
+            user.first_name = item.get('first_name')
+        if item.get('last_name') is not None:
+            user.last_name = item.get('last_name')
+    User.save_many(users)
+    return jsonify([user.to_json() for user in users]), 200
+
+
+@app_views.route('/users/bulk', methods=['DELETE'], strict_slashes=False)
+def delete_users() -> str:
+    """ DELETE /api/v1/users/bulk
+    JSON body:
+      - list of User IDs
+    Return:
+      - empty JSON if the Users have been correctly deleted, at once
+      - 404 if one of the User IDs doesn't exist (none is deleted)
+    """
+    rj = get_json_list()
+    if rj is None:
+        return jsonify({'error': "Wrong format"}), 400
+    users = []
+    for user_id in rj:
+        user = User.get(user_id) if type(user_id) is str else None
+        if user is None:
+            abort(404)
+        users.append(user)
+    User.remove_many(users)
+    return jsonify({}), 200
@@ -9,7 +9,9 @@ from models.user import User
 user_email = "bob100@hbtn.io"
 user_clear_pwd = "H0lberton:School:98!"
 
-user = User()
+# emails are unique: reuse the user of a previous run, if any
+users = User.search({'email': user_email})
+user = users[0] if users else User()
 user.email = user_email
 user.password = user_clear_pwd
 print("New user: {}".format(user.id))
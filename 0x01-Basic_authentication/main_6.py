@@ -8,7 +8,9 @@ from models.user import User
 """ Create a user test """
 user_email = "bob@hbtn.io"
 user_clear_pwd = "H0lbertonSchool98!"
-user = User()
+# emails are unique: reuse the user of a previous run, if any
+users = User.search({'email': user_email})
+user = users[0] if users else User()
 user.email = user_email
 user.password = user_clear_pwd
 print("New user: {} / {}".format(user.id, user.display_name()))
@@ -0,0 +1,710 @@
+#!/usr/bin/env python3
+""" JSON file storage engine module
+"""
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from models.engine.storage import Storage
+from typing import TypeVar, List, Iterable, Union
+from os import path
+import fcntl
+import json
+import os
+import threading
+
+
+DATA = {}
+# secondary indexes: {class name: {attribute: {value: {object ID: None}}}}
+INDEXES = {}
+# indexed values of each object: {class name: {object ID: {attribute: value}}}
+INDEXED_VALUES = {}
+# sorted object IDs: {class name: [object ID]}
+ORDERED_IDS = {}
+
+# 'snapshot' rewrites .db_<class>.json on every write, 'journal' appends
+# one record per write to .db_<class>.journal instead
+STORAGE_MODE = os.getenv('BASE_STORAGE_MODE', 'snapshot')
+# journal records after which the journal is compacted into the snapshot
+COMPACT_THRESHOLD = int(os.getenv('BASE_JOURNAL_COMPACT_THRESHOLD', '1000'))
+JOURNAL_SIZES = {}
+# version stamps of the storage files as last read or written by this
+# process: {class name: (snapshot, set-aside journal, journal inode, offset)}
+STAMPS = {}
+STORAGE_LOCK = threading.RLock()
+LOCK_DEPTHS = {}
+# incremented whenever the objects of a class change: {class name: int}
+VERSIONS = {}
+# keep the loaded records as JSON, building objects on first access
+LAZY_LOAD = os.getenv('BASE_LAZY_LOAD', '').lower() in ('1', 'true', 'yes')
+# objects kept built in lazy mode, per class
+LAZY_CACHE_SIZE = int(os.getenv('BASE_LAZY_CACHE_SIZE', '10000'))
+
+
+def _stamp(file_path: str) -> tuple:
+    """ Return the (inode, mtime, size) of a file, or None if missing
+    """
+    try:
+        st = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _fsync_dir(file_path: str):
+    """ Flush to disk the directory entry of a created or renamed file
+    """
+    fd = os.open(path.dirname(file_path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _path(cls: type, suffix: str) -> str:
+    """ Return the path of one of the storage files of a class
+    """
+    return ".db_{}.{}".format(cls.__name__, suffix)
+
+
+class LazyObjects(MutableMapping):
+    """ Objects of a class by ID, built from their JSON on first access
+
+    Records are held as the JSON dict they were loaded from; only the
+    cache_size objects accessed last are kept built, the others being
+    turned back into JSON. Iteration keeps the insertion order.
+    """
+
+    def __init__(self, cls: type, cache_size: int = LAZY_CACHE_SIZE):
+        """ Initialize an empty mapping of objects of class cls
+        """
+        self._cls = cls
+        self._cache_size = cache_size
+        # object ID: its JSON dict, or the object once built
+        self._entries = {}
+        # IDs of the built objects, least recently used first
+        self._built = OrderedDict()
+        self._lock = threading.RLock()
+
+    def load(self, obj_id: str, obj_json: dict):
+        """ Add or replace a record, given as JSON
+        """
+        with self._lock:
+            self._entries[obj_id] = obj_json
+            self._built.pop(obj_id, None)
+
+    def entries(self) -> List[Union[dict, TypeVar('Base')]]:
+        """ Return every record, as its JSON dict or its built object
+        """
+        with self._lock:
+            return list(self._entries.values())
+
+    def _touch(self, obj_id: str):
+        """ Mark an object as just used, unbuilding the least recent ones
+        """
+        self._built[obj_id] = None
+        self._built.move_to_end(obj_id)
+        while len(self._built) > self._cache_size:
+            old_id, _ = self._built.popitem(last=False)
+            self._entries[old_id] = self._entries[old_id].to_json(True)
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Return an object, building it if needed
+        """
+        with self._lock:
+            entry = self._entries[obj_id]
+            if type(entry) is dict:
+                entry = self._cls(**entry)
+                self._entries[obj_id] = entry
+            self._touch(obj_id)
+            return entry
+
+    def __setitem__(self, obj_id: str, obj: TypeVar('Base')):
+        """ Add or replace an object
+        """
+        with self._lock:
+            self._entries[obj_id] = obj
+            self._touch(obj_id)
+
+    def __delitem__(self, obj_id: str):
+        """ Drop an object
+        """
+        with self._lock:
+            del self._entries[obj_id]
+            self._built.pop(obj_id, None)
+
+    def pop(self, obj_id: str, *default):
+        """ Drop an object, without building it: return True if it was
+        held, else default
+        """
+        with self._lock:
+            if obj_id not in self._entries:
+                if default:
+                    return default[0]
+                raise KeyError(obj_id)
+            del self[obj_id]
+            return True
+
+    def __contains__(self, obj_id: str) -> bool:
+        """ Check if an object is held
+        """
+        return obj_id in self._entries
+
+    def __iter__(self):
+        """ Iterate over the object IDs
+        """
+        with self._lock:
+            return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        """ Count the objects
+        """
+        return len(self._entries)
+
+
+class JSONStorage(Storage):
+    """ Keeps every object in DATA and persists them in JSON files
+
+    Each class is stored in a .db_<class>.json snapshot, followed in
+    journal mode by a .db_<class>.journal of the writes made since.
+
+    With LAZY_LOAD, loading only indexes the records: objects are built
+    when get or search returns them (see LazyObjects).
+    """
+
+    def load(self, cls: type):
+        """ Load all objects from file
+
+        The snapshot is loaded first, then the journal records appended
+        after it are replayed on top.
+        """
+        s_class = cls.__name__
+        with self._locked(cls, shared=True):
+            # stamp the files before reading them: a change made in
+            # between then only causes one more reload
+            snapshot, old_journal, journal_ino, _ = self._stamps(cls)
+            DATA[s_class] = LazyObjects(cls) if LAZY_LOAD else {}
+            self._reset_indexes(cls)
+            # sorted once everything is loaded
+            ORDERED_IDS[s_class] = None
+            JOURNAL_SIZES[s_class] = 0
+            VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+
+            file_path = _path(cls, "json")
+            if path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        self._load(cls, obj_id, obj_json)
+
+            if path.exists(_path(cls, "journal.old")):
+                self._replay_journal(cls, _path(cls, "journal.old"))
+            offset = 0
+            if path.exists(_path(cls, "journal")):
+                count, offset = self._replay_journal(
+                        cls, _path(cls, "journal"))
+                JOURNAL_SIZES[s_class] = count
+            ORDERED_IDS[s_class] = sorted(DATA[s_class])
+            STAMPS[s_class] = (snapshot, old_journal, journal_ino, offset)
+
+    def _replay_journal(
+            self,
+            cls: type,
+            journal_path: str,
+            offset: int = 0
+            ) -> tuple:
+        """ Apply the records of a journal file to the loaded objects
+
+        Replay starts at byte offset. A last line without its newline is
+        still being written (or was torn by a crash) and is left for
+        later; a torn record followed by others is skipped.
+
+        Return the number of records applied and the offset reached.
+        """
+        s_class = cls.__name__
+        count = 0
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                obj_id = record['id']
+                if record['op'] == 'save':
+                    self._load(cls, obj_id, record['obj'])
+                elif DATA[s_class].pop(obj_id, None) is not None:
+                    self._unindex(cls, obj_id)
+                    self._unorder(s_class, obj_id)
+                count += 1
+        return count, offset
+
+    def _load(self, cls: type, obj_id: str, obj_json: dict):
+        """ Add or replace a loaded object, given as JSON
+        """
+        s_class = cls.__name__
+        if obj_id not in DATA[s_class]:
+            self._order(s_class, obj_id)
+        if LAZY_LOAD:
+            DATA[s_class].load(obj_id, obj_json)
+            # indexed attributes are stored as is
+            self._index_values(cls, obj_id, {
+                k: obj_json.get(k) for k in cls.indexed_attributes})
+        else:
+            obj = cls(**obj_json)
+            DATA[s_class][obj_id] = obj
+            self._index(obj, check_unique=False)
+
+    @staticmethod
+    def _entries(s_class: str) -> list:
+        """ Return the objects of a class, some as JSON in lazy mode
+        """
+        objs = DATA.get(s_class, {})
+        if isinstance(objs, LazyObjects):
+            return objs.entries()
+        return list(objs.values())
+
+    def save_all(self, cls: type):
+        """ Save all objects to file
+
+        The snapshot replaces the previous one atomically, and makes any
+        journal redundant.
+        """
+        s_class = cls.__name__
+        with self._locked(cls):
+            self._write_snapshot(_path(cls, "json"), self._entries(s_class))
+            for suffix in ("journal.old", "journal"):
+                if path.exists(_path(cls, suffix)):
+                    os.remove(_path(cls, suffix))
+            JOURNAL_SIZES[s_class] = 0
+            STAMPS[s_class] = self._stamps(cls)
+
+    @staticmethod
+    def _write_snapshot(
+            file_path: str,
+            objs: Iterable[Union[dict, TypeVar('Base')]]
+            ):
+        """ Write objects, or their JSON, to a snapshot file, crash-safely
+
+        The objects go to a temporary file which is flushed to disk and
+        then renamed over the snapshot, so that a crash leaves either the
+        previous snapshot or the new one, never a truncated file.
+        """
+        objs_json = {}
+        for obj in objs:
+            if type(obj) is dict:
+                objs_json[obj['id']] = obj
+            else:
+                objs_json[obj.id] = obj.to_json(True)
+
+        tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(objs_json, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        _fsync_dir(file_path)
+
+    def append_to_journal(self, op: str, *objs: TypeVar('Base')):
+        """ Append one save or remove record per object to the journal
+        file, in a single write
+
+        Once the journal holds COMPACT_THRESHOLD records, it is compacted
+        into the snapshot in the background.
+        """
+        cls = objs[0].__class__
+        s_class = cls.__name__
+        lines = []
+        for obj in objs:
+            record = {'op': op, 'id': obj.id}
+            if op == 'save':
+                record['obj'] = obj.to_json(True)
+            lines.append(json.dumps(record) + "\n")
+        line = "".join(lines).encode()
+
+        with self._locked(cls):
+            self._sync(cls)
+            with open(_path(cls, "journal"), 'ab+') as f:
+                end = f.tell()
+                if end > 0 and os.pread(f.fileno(), 1, end - 1) != b"\n":
+                    # isolate the record torn by a crash from this one
+                    line = b"\n" + line
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+                journal_ino = os.fstat(f.fileno()).st_ino
+                end = f.tell()
+            if journal_ino != STAMPS[s_class][2]:
+                _fsync_dir(_path(cls, "journal"))
+            # this process is in sync: it only just appended the records
+            STAMPS[s_class] = STAMPS[s_class][:2] + (journal_ino, end)
+            JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + len(objs)
+            if JOURNAL_SIZES[s_class] >= COMPACT_THRESHOLD:
+                self.compact(cls)
+
+    def compact(self, cls: type, wait: bool = False) -> bool:
+        """ Fold the journal of a class into a new snapshot
+
+        The journal is set aside so that appends go to a fresh one while
+        the snapshot is written by a background thread (or the calling
+        one, with wait). Replaying the set-aside journal over a snapshot
+        taken later is harmless, so a crash at any point loses nothing.
+
+        Return False if a compaction of the class is already running, in
+        this process or another one.
+        """
+        s_class = cls.__name__
+        compact_lock = open(_path(cls, "compact.lock"), 'a')
+        try:
+            fcntl.flock(compact_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            compact_lock.close()
+            return False
+
+        try:
+            with self._locked(cls):
+                self._sync(cls)
+                if path.exists(_path(cls, "journal.old")):
+                    # nobody is compacting, so one was interrupted
+                    self.save_all(cls)
+                    compact_lock.close()
+                    return True
+                if path.exists(_path(cls, "journal")):
+                    os.replace(_path(cls, "journal"),
+                               _path(cls, "journal.old"))
+                JOURNAL_SIZES[s_class] = 0
+                STAMPS[s_class] = self._stamps(cls)
+                objs = self._entries(s_class)
+        except BaseException:
+            compact_lock.close()
+            raise
+
+        def _compact():
+            try:
+                self._write_snapshot(_path(cls, "json"), objs)
+                snapshot = _stamp(_path(cls, "json"))
+                with self._locked(cls):
+                    # the new snapshot holds nothing this process lacks
+                    STAMPS[s_class] = (snapshot,) + STAMPS[s_class][1:]
+                    self._sync(cls)
+                    os.remove(_path(cls, "journal.old"))
+                    _fsync_dir(_path(cls, "journal.old"))
+                    STAMPS[s_class] = self._stamps(cls)
+            finally:
+                compact_lock.close()
+
+        if wait:
+            _compact()
+        else:
+            threading.Thread(target=_compact, daemon=True).start()
+        return True
+
+    @staticmethod
+    def _stamps(cls: type) -> tuple:
+        """ Return the version stamp of the storage files of a class
+
+        That is the stamps of the snapshot and of the set-aside journal,
+        then the inode and size of the journal (None and 0 if missing).
+        """
+        journal = _stamp(_path(cls, "journal"))
+        if journal is None:
+            return (_stamp(_path(cls, "json")),
+                    _stamp(_path(cls, "journal.old")), None, 0)
+        return (_stamp(_path(cls, "json")), _stamp(_path(cls, "journal.old")),
+                journal[0], journal[2])
+
+    def _sync(self, cls: type):
+        """ Reload the objects if another process changed the files
+
+        Records appended to the journal are replayed alone; any other
+        change reloads everything.
+        """
+        s_class = cls.__name__
+        with STORAGE_LOCK:
+            known = STAMPS.get(s_class)
+            current = self._stamps(cls)
+            if known == current:
+                return
+            if known is not None and known[:2] == current[:2] and\
+                    current[2] is not None and current[3] > known[3] and\
+                    known[2] in (None, current[2]):
+                offset = known[3] if known[2] is not None else 0
+                with self._locked(cls, shared=True):
+                    count, offset = self._replay_journal(
+                            cls, _path(cls, "journal"), offset)
+                JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + count
+                if count:
+                    VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+                STAMPS[s_class] = current[:3] + (offset,)
+                return
+            self.load(cls)
+
+    @staticmethod
+    @contextmanager
+    def _locked(cls: type, shared: bool = False):
+        """ Hold the storage lock of a class
+
+        Threads of this process are serialized by STORAGE_LOCK, and
+        processes by a lock on .db_<class>.lock: shared for reading the
+        files, exclusive for writing them. Nesting is allowed.
+        """
+        s_class = cls.__name__
+        with STORAGE_LOCK:
+            if LOCK_DEPTHS.get(s_class, 0) > 0:
+                LOCK_DEPTHS[s_class] += 1
+                try:
+                    yield
+                finally:
+                    LOCK_DEPTHS[s_class] -= 1
+                return
+
+            with open(_path(cls, "lock"), 'a') as lock_file:
+                fcntl.flock(lock_file,
+                            fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                LOCK_DEPTHS[s_class] = 1
+                try:
+                    yield
+                finally:
+                    LOCK_DEPTHS[s_class] = 0
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Save one object
+        """
+        self.save_many(obj.__class__, [obj])
+
+    def save_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Save objects of a class, writing the files once
+
+        Raises ValueError, saving none of the objects, if a unique value
+        would be held by two objects.
+        """
+        if not objs:
+            return
+        s_class = cls.__name__
+        with self._locked(cls):
+            self._sync(cls)
+            self._check_unique(cls, objs)
+            for obj in objs:
+                self._index(obj, check_unique=False)
+                if obj.id not in DATA[s_class]:
+                    self._order(s_class, obj.id)
+                DATA[s_class][obj.id] = obj
+            VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+            if STORAGE_MODE == 'journal':
+                self.append_to_journal('save', *objs)
+            else:
+                self.save_all(cls)
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Remove one object
+        """
+        self.remove_many(obj.__class__, [obj])
+
+    def remove_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Remove objects of a class, writing the files once
+        """
+        s_class = cls.__name__
+        with self._locked(cls):
+            self._sync(cls)
+            removed = []
+            for obj in objs:
+                if obj.id in DATA[s_class]:
+                    del DATA[s_class][obj.id]
+                    self._unindex(cls, obj.id)
+                    self._unorder(s_class, obj.id)
+                    removed.append(obj)
+            if not removed:
+                return
+            VERSIONS[s_class] = VERSIONS.get(s_class, 0) + 1
+            if STORAGE_MODE == 'journal':
+                self.append_to_journal('remove', *removed)
+            else:
+                self.save_all(cls)
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of a class
+        """
+        self._sync(cls)
+        return len(DATA[cls.__name__].keys())
+
+    def version(self, cls: type) -> int:
+        """ Return the version of the objects of a class
+        """
+        self._sync(cls)
+        return VERSIONS[cls.__name__]
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        self._sync(cls)
+        return DATA[cls.__name__].get(id)
+
+    def page(
+            self,
+            cls: type,
+            after: str = None,
+            limit: int = None
+            ) -> List[TypeVar('Base')]:
+        """ Return the objects of a class in ID order, from the first one
+        after the ID after, limit at most
+        """
+        s_class = cls.__name__
+        self._sync(cls)
+        ids = ORDERED_IDS[s_class]
+        start = 0 if after is None else bisect_right(ids, after)
+        end = None if limit is None else start + limit
+        objs = DATA[s_class]
+        # IDs removed meanwhile are skipped
+        return [obj for obj in map(objs.get, ids[start:end])
+                if obj is not None]
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+
+        When one of the attributes is indexed, only the objects holding
+        its value are checked instead of every object of the class (and,
+        in lazy mode, built).
+        """
+        s_class = cls.__name__
+        self._sync(cls)
+
+        def _search(obj):
+            if len(attributes) == 0:
+                return True
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        objs = DATA[s_class]
+        candidates = objs.values()
+        for k, v in attributes.items():
+            if k not in cls.indexed_attributes:
+                continue
+            try:
+                obj_ids = INDEXES[s_class][k].get(v, {})
+            except TypeError:
+                # unhashable value; it cannot be indexed
+                continue
+            candidates = [objs[obj_id] for obj_id in obj_ids]
+            break
+
+        return list(filter(_search, candidates))
+
+    @staticmethod
+    def _reset_indexes(cls: type):
+        """ Empty the indexes of a class
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {k: {} for k in cls.indexed_attributes}
+        INDEXED_VALUES[s_class] = {}
+
+    @staticmethod
+    def _order(s_class: str, obj_id: str):
+        """ Add an object ID to the sorted IDs of its class
+        """
+        ids = ORDERED_IDS[s_class]
+        if ids is not None:
+            ids.insert(bisect_left(ids, obj_id), obj_id)
+
+    @staticmethod
+    def _unorder(s_class: str, obj_id: str):
+        """ Drop an object ID from the sorted IDs of its class
+        """
+        ids = ORDERED_IDS[s_class]
+        if ids is not None:
+            i = bisect_left(ids, obj_id)
+            if i < len(ids) and ids[i] == obj_id:
+                del ids[i]
+
+    @staticmethod
+    def _check_unique(cls: type, objs: List[TypeVar('Base')]):
+        """ Raise ValueError if saving objects would give a unique value
+        to two objects
+
+        Only the objects newly taking a value are checked: duplicates
+        stored before the value was unique (see User) can still be saved
+        as long as they keep it.
+        """
+        s_class = cls.__name__
+        obj_ids = {obj.id for obj in objs}
+        for k, unique in cls.indexed_attributes.items():
+            if not unique:
+                continue
+            # value: {ID of an object of the batch: whether it keeps it}
+            holders = {}
+            for obj in objs:
+                v = getattr(obj, k, None)
+                if v is None:
+                    continue
+                kept = INDEXED_VALUES[s_class].get(obj.id, {}).get(k) == v
+                holders.setdefault(v, {})[obj.id] = kept
+            for v, batch in holders.items():
+                if all(batch.values()):
+                    continue
+                if len(batch) > 1:
+                    raise ValueError("{} {} already exists".format(k, v))
+                # objects of the batch are indexed again anyway
+                for other_id in INDEXES[s_class][k].get(v, {}):
+                    if other_id not in obj_ids:
+                        raise ValueError("{} {} already exists".format(k, v))
+
+    def _index(self, obj: TypeVar('Base'), check_unique: bool = True):
+        """ Index the current attribute values of an object
+
+        Raises ValueError, before changing any index, if a unique value
+        is already held by another object.
+        """
+        cls = obj.__class__
+        if not cls.indexed_attributes:
+            return
+        values = {k: getattr(obj, k, None) for k in cls.indexed_attributes}
+        self._index_values(cls, obj.id, values, check_unique)
+
+    def _index_values(
+            self,
+            cls: type,
+            obj_id: str,
+            values: dict,
+            check_unique: bool = False
+            ):
+        """ Index the values of the indexed attributes of an object
+        """
+        if not cls.indexed_attributes:
+            return
+        s_class = cls.__name__
+        if check_unique:
+            for k, unique in cls.indexed_attributes.items():
+                if not unique or values[k] is None:
+                    continue
+                if INDEXED_VALUES[s_class].get(obj_id, {}).get(k) ==\
+                        values[k]:
+                    # already held, maybe along with older duplicates
+                    continue
+                for other_id in INDEXES[s_class][k].get(values[k], {}):
+                    if other_id != obj_id:
+                        raise ValueError("{} {} already exists".format(
+                            k, values[k]))
+
+        self._unindex(cls, obj_id)
+        for k, v in values.items():
+            INDEXES[s_class][k].setdefault(v, {})[obj_id] = None
+        INDEXED_VALUES[s_class][obj_id] = values
+
+    @staticmethod
+    def _unindex(cls: type, obj_id: str):
+        """ Drop an object from the indexes of its class
+        """
+        s_class = cls.__name__
+        values = INDEXED_VALUES[s_class].pop(obj_id, None)
+        if values is None:
+            return
+        for k, v in values.items():
+            obj_ids = INDEXES[s_class][k][v]
+            del obj_ids[obj_id]
+            if not obj_ids:
+                del INDEXES[s_class][k][v]
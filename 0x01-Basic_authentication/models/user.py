@@ -1,14 +1,22 @@
 #!/usr/bin/env python3
 """ User module
 """
-import hashlib
+from models import hashers
 from models.base import Base
+from typing import List
 
 
 class User(Base):
     """ User class
     """
 
+    # emails became unique after users were stored, so older data may
+    # hold duplicates: the JSON engine keeps saving them as long as their
+    # email is unchanged, while the SQLite engine raises ValueError until
+    # they are given distinct emails or removed
+    indexed_attributes = {'email': True}
+    __slots__ = ('email', '_password', 'first_name', 'last_name')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
@@ -26,22 +34,44 @@ class User(Base):
 
     @password.setter
     def password(self, pwd: str):
-        """ Setter of a new password: encrypt in SHA256
+        """ Setter of a new password: hash it with the current hasher
         """
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = hashers.hash_password(pwd)
+
+    @classmethod
+    def set_passwords(cls, users: List['User'], pwds: List[str]):
+        """ Set the new password of each user at once, like the password
+        setter but hashing them in parallel
+        """
+        hashed = iter(hashers.hash_passwords(
+            [pwd for pwd in pwds if type(pwd) is str]))
+        for user, pwd in zip(users, pwds):
+            user._password = next(hashed) if type(pwd) is str else None
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
+
+        A valid password hashed with another hasher or a lower cost than
+        the current settings (like legacy SHA256 hashes) is hashed again
+        and the user saved. This upgrade is best-effort: if the save
+        fails, the old hash is kept, to be upgraded on a later login.
         """
         if pwd is None or type(pwd) is not str:
             return False
         if self.password is None:
             return False
-        pwd_e = pwd.encode()
-        return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
+        valid, new_password = hashers.verify_password(pwd, self.password)
+        if new_password is not None:
+            old_values = (self._password, self._updated_at)
+            self._password = new_password
+            try:
+                self.save()
+            except Exception:
+                self._password, self._updated_at = old_values
+        return valid
 
     def display_name(self) -> str:
         """ Display User name based on email/first_name/last_name
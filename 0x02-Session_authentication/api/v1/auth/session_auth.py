@@ -2,6 +2,7 @@
 """Session authentication module.
 """
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_backends import get_backend
 from models.user import User
 from typing import TypeVar, Optional
 import base64
@@ -12,6 +13,10 @@ class SessionAuth(Auth):
     """Session authentication implementation.
     """
     user_id_by_session_id = {}
+    # sessions shared across processes (SESSION_BACKEND), replacing
+    # user_id_by_session_id; None keeps them in the latter
+    backend = get_backend()
+    session_duration = 0
 
     def create_session(self, user_id: str = None) -> Optional[str]:
         """ Creates a session ID for a user_id.
@@ -25,6 +30,11 @@ class SessionAuth(Auth):
         if user_id is None or type(user_id) is not str:
             return None
         session_id = str(uuid.uuid4())
+        if self.backend is not None:
+            if not self.backend.create(session_id, user_id,
+                                       self.session_duration):
+                return None
+            return session_id
         self.user_id_by_session_id[session_id] = user_id
         return session_id
 
@@ -33,6 +43,8 @@ class SessionAuth(Auth):
         """
         if session_id is None or type(session_id) is not str:
             return None
+        if self.backend is not None:
+            return self.backend.lookup(session_id)
 
         user_id = self.user_id_by_session_id.get(session_id)
 
@@ -62,12 +74,15 @@ class SessionAuth(Auth):
         session_id = self.session_cookie(request)
         if session_id is None:
             return False
+        if self.backend is not None:
+            return self.backend.destroy(session_id)
 
         user_id = self.user_id_for_session_id(session_id)
         if user_id is None:
             return False
 
-        # user has an active session to delete
-        del self.user_id_by_session_id[session_id]
+        # user has an active session to delete; it may have been evicted
+        # from the in-memory store meanwhile
+        self.user_id_by_session_id.pop(session_id, None)
 
         return True
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Shared session backends module.
+
+Sessions kept in a backend are seen by every process of the API, unlike
+the in-process SessionAuth.user_id_by_session_id. SESSION_BACKEND picks
+the backend: 'sqlite', 'redis', or none (the default, in-process).
+"""
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+
+class SessionBackend(ABC):
+    """Interface of the session backends.
+
+    Each operation is atomic, and sessions expire in the backend itself.
+    Backends able to count their sessions also have a stats() method.
+    """
+    @abstractmethod
+    def create(self, session_id: str, user_id: str, duration: int) -> bool:
+        """Stores a session, expiring after duration seconds (never if 0).
+
+        Returns False if the session ID is already taken.
+        """
+
+    @abstractmethod
+    def lookup(self, session_id: str) -> Optional[str]:
+        """Returns the user ID of a live session, or None.
+        """
+
+    @abstractmethod
+    def destroy(self, session_id: str) -> bool:
+        """Deletes a session; returns False if there was no live one.
+        """
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions in a SQLite database shared by the local processes.
+
+    The database is in WAL mode, so lookups never wait for writes.
+    Expired sessions are deleted in batches as sessions get created.
+    """
+    def __init__(self, db_path: str, purge_batch: int = 100):
+        """Initializes the backend on the database file db_path.
+        """
+        self.db_path = db_path
+        self.purge_batch = purge_batch
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions "
+                     "(session_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, "
+                     "expires_at REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at "
+                     "ON sessions (expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Returns the database connection of the calling thread.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, session_id: str, user_id: str, duration: int) -> bool:
+        """Stores a session, expiring after duration seconds (never if 0).
+        """
+        now = time.time()
+        expires_at = now + duration if duration > 0 else None
+        conn = self._connection()
+        conn.execute("DELETE FROM sessions WHERE rowid IN (SELECT rowid "
+                     "FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                     (now, self.purge_batch))
+        try:
+            conn.execute("INSERT INTO sessions VALUES (?, ?, ?)",
+                         (session_id, user_id, expires_at))
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def lookup(self, session_id: str) -> Optional[str]:
+        """Returns the user ID of a live session, or None.
+        """
+        row = self._connection().execute(
+                "SELECT user_id FROM sessions WHERE session_id = ? AND "
+                "(expires_at IS NULL OR expires_at > ?)",
+                (session_id, time.time())).fetchone()
+        return None if row is None else row[0]
+
+    def destroy(self, session_id: str) -> bool:
+        """Deletes a session; returns False if there was no live one.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            live = conn.execute(
+                    "SELECT 1 FROM sessions WHERE session_id = ? AND "
+                    "(expires_at IS NULL OR expires_at > ?)",
+                    (session_id, time.time())).fetchone() is not None
+            conn.execute("DELETE FROM sessions WHERE session_id = ?",
+                         (session_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return live
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the gauges of the backend.
+
+        'live' and 'expired' count the sessions held, the latter awaiting
+        their deletion.
+        """
+        held, expired = self._connection().execute(
+                "SELECT COUNT(*), COUNT(CASE WHEN expires_at <= ? THEN 1 END) "
+                "FROM sessions", (time.time(),)).fetchone()
+        return {'live': held - expired, 'expired': expired}
+
+
+class RedisError(Exception):
+    """Error reply of a Redis server.
+    """
+
+
+class RedisConnection:
+    """Connection to a server speaking the Redis protocol (RESP).
+    """
+    def __init__(self, host: str, port: int, timeout: float):
+        """Connects to host:port.
+        """
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+    @staticmethod
+    def encode(command: tuple) -> bytes:
+        """Returns a command as a RESP array of bulk strings.
+        """
+        parts = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def read_reply(self):
+        """Reads one reply: str, int, None, list, or RedisError.
+        """
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('connection closed by the server')
+        kind, data = line[:1], line[1:-2]
+        if kind == b'+':
+            return data.decode()
+        if kind == b'-':
+            return RedisError(data.decode())
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            if int(data) < 0:
+                return None
+            value = self.reader.read(int(data) + 2)
+            if len(value) != int(data) + 2:
+                raise ConnectionError('connection closed by the server')
+            return value[:-2].decode()
+        if kind == b'*':
+            if int(data) < 0:
+                return None
+            return [self.read_reply() for _ in range(int(data))]
+        raise ConnectionError('invalid reply from the server')
+
+    def pipeline(self, *commands: tuple) -> List:
+        """Sends commands at once, then reads their replies in order.
+
+        Error replies are returned, not raised.
+        """
+        self.sock.sendall(b''.join(self.encode(c) for c in commands))
+        return [self.read_reply() for _ in commands]
+
+    def close(self):
+        """Closes the connection.
+        """
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RedisSessionBackend(SessionBackend):
+    """Sessions in a server speaking the Redis protocol.
+
+    Sessions are string keys holding the user ID, expiring through the
+    server. Connections come from a pool of at most pool_size. Each
+    session operation is a single command; execute() pipelines several,
+    as done for the AUTH and SELECT of a new connection.
+
+    The server can't count the sessions alone among its keys, so there
+    is no stats().
+    """
+    def __init__(
+            self,
+            host: str = 'localhost',
+            port: int = 6379,
+            db: int = 0,
+            password: str = None,
+            prefix: str = 'session:',
+            pool_size: int = 10,
+            timeout: float = 5
+            ):
+        """Initializes the backend; connections open on first use.
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.prefix = prefix
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def _connect(self) -> RedisConnection:
+        """Opens a connection, authenticated and on the right database.
+        """
+        conn = RedisConnection(self.host, self.port, self.timeout)
+        commands = []
+        if self.password:
+            commands.append(('AUTH', self.password))
+        if self.db:
+            commands.append(('SELECT', self.db))
+        try:
+            for reply in conn.pipeline(*commands):
+                if isinstance(reply, RedisError):
+                    raise reply
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _idle_connection(self) -> Optional[RedisConnection]:
+        """Returns the most recently used idle connection, or None.
+        """
+        with self._lock:
+            return self._idle.pop() if self._idle else None
+
+    def _give_back(self, conn: RedisConnection):
+        """Returns a healthy borrowed connection to the idle ones.
+        """
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[RedisConnection]:
+        """Borrows a connection from the pool for the `with` block.
+
+        A connection that failed is closed instead of returned.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError('no Redis connection available in the pool')
+        try:
+            conn = self._idle_connection() or self._connect()
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            self._give_back(conn)
+        finally:
+            self._slots.release()
+
+    def execute(self, *commands: tuple) -> List:
+        """Runs commands in one pipeline; returns their replies.
+
+        An idle connection may have been dropped by the server meanwhile
+        (idle timeout, restart, failover): if it fails, the commands are
+        sent again once on a new connection. Raises the first error reply.
+        """
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError('no Redis connection available in the pool')
+        try:
+            replies = None
+            conn = self._idle_connection()
+            if conn is not None:
+                try:
+                    replies = conn.pipeline(*commands)
+                except (ConnectionError, OSError):
+                    conn.close()
+                    conn = None
+                except BaseException:
+                    conn.close()
+                    raise
+            if conn is None:
+                conn = self._connect()
+                try:
+                    replies = conn.pipeline(*commands)
+                except BaseException:
+                    conn.close()
+                    raise
+            self._give_back(conn)
+        finally:
+            self._slots.release()
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def create(self, session_id: str, user_id: str, duration: int) -> bool:
+        """Stores a session, expiring after duration seconds (never if 0).
+        """
+        command = ('SET', self.prefix + session_id, user_id, 'NX')
+        if duration > 0:
+            command += ('EX', duration)
+        return self.execute(command)[0] == 'OK'
+
+    def lookup(self, session_id: str) -> Optional[str]:
+        """Returns the user ID of a live session, or None.
+        """
+        return self.execute(('GET', self.prefix + session_id))[0]
+
+    def destroy(self, session_id: str) -> bool:
+        """Deletes a session; returns False if there was no live one.
+        """
+        return self.execute(('DEL', self.prefix + session_id))[0] == 1
+
+
+def get_backend() -> Optional[SessionBackend]:
+    """Returns the backend chosen by SESSION_BACKEND, or None.
+    """
+    backend = None
+    session_backend = os.getenv('SESSION_BACKEND', '')
+    if session_backend == 'sqlite':
+        backend = SQLiteSessionBackend(
+                os.getenv('SESSION_SQLITE_PATH', '.sessions.sqlite3'))
+    elif session_backend == 'redis':
+        backend = RedisSessionBackend(
+                host=os.getenv('SESSION_REDIS_HOST', 'localhost'),
+                port=int(os.getenv('SESSION_REDIS_PORT', '6379')),
+                db=int(os.getenv('SESSION_REDIS_DB', '0')),
+                password=os.getenv('SESSION_REDIS_PASSWORD'),
+                prefix=os.getenv('SESSION_REDIS_PREFIX', 'session:'),
+                pool_size=int(os.getenv('SESSION_REDIS_POOL_SIZE', '10')),
+                timeout=float(os.getenv('SESSION_REDIS_TIMEOUT', '5')),
+                )
+    return backend
@@ -35,10 +35,6 @@ class SessionDBAuth(SessionExpAuth):
 
         # retrieve the UserSession instance associated with session_id
         attr = {'session_id': session_id}
-        us = UserSession(
-                'fakeUserID',
-                'fakeSessionID',
-                )  # for initializing DATA in models/base.py
         user_sessions = UserSession.search(attr)  # Base method
         if not user_sessions:
             # no result; empty list
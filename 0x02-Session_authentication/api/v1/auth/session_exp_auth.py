@@ -5,6 +5,7 @@ from api.v1.auth.auth import Auth
 from models.user import User
 from typing import TypeVar, Optional
 from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_store import SessionStore
 from datetime import datetime, timedelta
 import os
 import uuid
@@ -13,7 +14,8 @@ import uuid
 class SessionExpAuth(SessionAuth):
     """ Implementation of an expirable session.
     """
-    user_id_by_session_id = {}
+    # evicts the expired sessions in the background
+    user_id_by_session_id = SessionStore()
 
     def __init__(self):
         session_duration = os.getenv('SESSION_DURATION')
@@ -22,6 +24,7 @@ class SessionExpAuth(SessionAuth):
         except (TypeError, ValueError):
             sess_dur = 0
         self.session_duration = sess_dur
+        self.user_id_by_session_id.duration = sess_dur
 
     def create_session(self, user_id=None):
         """ Create an expiring session ID.
@@ -29,6 +32,9 @@ class SessionExpAuth(SessionAuth):
         session_id = super().create_session(user_id)
         if session_id is None:
             return None
+        if self.backend is not None:
+            # expires in the backend
+            return session_id
 
         self.user_id_by_session_id[session_id] = {
                 'user_id': user_id,
@@ -39,19 +45,21 @@ class SessionExpAuth(SessionAuth):
     def user_id_for_session_id(self, session_id=None):
         """ Returns the user ID for session_id.
         """
-        if session_id is None or\
-                session_id not in self.user_id_by_session_id or\
-                'created_at' not in self.user_id_by_session_id[session_id]:
+        if self.backend is not None:
+            return super().user_id_for_session_id(session_id)
+        if session_id is None:
+            return None
+        # read once: the session may expire or be swept meanwhile
+        session = self.user_id_by_session_id.get(session_id)
+        if type(session) is not dict or 'created_at' not in session:
             return None
 
-        # session_id and created_at keys exist at this point
-
-        user_id = self.user_id_by_session_id[session_id].get('user_id')
+        user_id = session.get('user_id')
         if self.session_duration <= 0:
             return user_id
 
         # retrieve session creation time
-        created_at = self.user_id_by_session_id[session_id].get('created_at')
+        created_at = session.get('created_at')
 
         # create a timedelta object for datetime arithmetic
         td = timedelta(seconds=self.session_duration)
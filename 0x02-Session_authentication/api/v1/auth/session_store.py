@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""Expiring session store module.
+"""
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Any, Dict, Iterator
+import heapq
+import os
+import threading
+import time
+
+# most sessions held; the least recently used ones are evicted beyond
+SESSION_STORE_SIZE = int(os.getenv('SESSION_STORE_SIZE', '100000'))
+# seconds between two sweeps of the expired sessions
+SESSION_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+# expired sessions evicted per batch, the store being locked meanwhile
+SESSION_SWEEP_BATCH = int(os.getenv('SESSION_SWEEP_BATCH', '1000'))
+
+
+class SessionStore(MutableMapping):
+    """Sessions by ID, expiring `duration` seconds after their creation.
+
+    Behaves like the dict it replaces: values are either a user ID or a
+    dict with the 'user_id' and its 'created_at' datetime. Only the
+    latter expire; an expired session reads as absent.
+
+    Expiry times are kept in a heap, from which a background thread
+    evicts the expired sessions every `sweep_interval` seconds, in
+    batches of `sweep_batch`. Beyond `size` sessions, the least recently
+    used one is evicted.
+    """
+    def __init__(
+            self,
+            duration: int = 0,
+            size: int = SESSION_STORE_SIZE,
+            sweep_interval: float = SESSION_SWEEP_INTERVAL,
+            sweep_batch: int = SESSION_SWEEP_BATCH
+            ):
+        """Initializes an empty store; no duration means no expiry.
+        """
+        self.duration = duration
+        self.size = size
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        # session ID: (value, expiry time or None), least recent first
+        self._sessions = OrderedDict()
+        # (expiry time, session ID); entries of replaced or evicted
+        # sessions are skipped, and dropped when the heap is rebuilt
+        self._expiries = []
+        self._lock = threading.RLock()
+        self._sweeper = None
+        self.evicted_expired = 0
+        self.evicted_lru = 0
+
+    def _expiry(self, value: Any) -> float:
+        """Returns the expiry time of a session value, or None.
+        """
+        if self.duration <= 0 or type(value) is not dict or\
+                type(value.get('created_at')) is not datetime:
+            return None
+        return value['created_at'].timestamp() + self.duration
+
+    def _live_entry(self, session_id: str) -> tuple:
+        """Returns the entry of a session, evicting it if expired.
+
+        Raises KeyError if there is no such live session.
+        """
+        value, expiry = self._sessions[session_id]
+        if expiry is not None and expiry <= time.time():
+            del self._sessions[session_id]
+            self.evicted_expired += 1
+            raise KeyError(session_id)
+        return value, expiry
+
+    def __getitem__(self, session_id: str) -> Any:
+        """Returns the value of a live session, marking it as used.
+        """
+        with self._lock:
+            value, _ = self._live_entry(session_id)
+            self._sessions.move_to_end(session_id)
+            return value
+
+    def __contains__(self, session_id: str) -> bool:
+        """Checks if a session is live, without marking it as used.
+        """
+        with self._lock:
+            try:
+                self._live_entry(session_id)
+            except KeyError:
+                return False
+            return True
+
+    def __setitem__(self, session_id: str, value: Any):
+        """Adds or replaces a session.
+        """
+        expiry = self._expiry(value)
+        with self._lock:
+            self._sessions[session_id] = (value, expiry)
+            self._sessions.move_to_end(session_id)
+            if expiry is not None:
+                heapq.heappush(self._expiries, (expiry, session_id))
+                if len(self._expiries) > 2 * len(self._sessions) + 1024:
+                    self._rebuild()
+            while len(self._sessions) > self.size:
+                self._sessions.popitem(last=False)
+                self.evicted_lru += 1
+            if expiry is not None and self._sweeper is None:
+                self._start_sweeper()
+
+    def __delitem__(self, session_id: str):
+        """Removes a session.
+        """
+        with self._lock:
+            del self._sessions[session_id]
+
+    def pop(self, session_id: str, *default: Any) -> Any:
+        """Removes a live session and returns its value, atomically.
+
+        Returns default if given and there is no such live session, else
+        raises KeyError.
+        """
+        with self._lock:
+            try:
+                value, _ = self._live_entry(session_id)
+            except KeyError:
+                if default:
+                    return default[0]
+                raise
+            del self._sessions[session_id]
+            return value
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterates over the session IDs, expired ones included.
+        """
+        with self._lock:
+            return iter(list(self._sessions))
+
+    def __len__(self) -> int:
+        """Returns the number of sessions, expired ones included.
+        """
+        return len(self._sessions)
+
+    def _is_current(self, expiry: float, session_id: str) -> bool:
+        """Checks if a heap entry is the expiry of a held session.
+        """
+        entry = self._sessions.get(session_id)
+        return entry is not None and entry[1] == expiry
+
+    def _rebuild(self):
+        """Drops the heap entries of sessions no longer held.
+        """
+        self._expiries = [(expiry, session_id)
+                          for expiry, session_id in self._expiries
+                          if self._is_current(expiry, session_id)]
+        heapq.heapify(self._expiries)
+
+    def sweep(self) -> int:
+        """Evicts every expired session, one batch at a time.
+
+        Returns the number of sessions evicted.
+        """
+        evicted = 0
+        while True:
+            with self._lock:
+                now = time.time()
+                for _ in range(self.sweep_batch):
+                    if not self._expiries or self._expiries[0][0] > now:
+                        return evicted
+                    expiry, session_id = heapq.heappop(self._expiries)
+                    if self._is_current(expiry, session_id):
+                        del self._sessions[session_id]
+                        self.evicted_expired += 1
+                        evicted += 1
+            # let requests in between two batches
+
+    def _start_sweeper(self):
+        """Starts the thread sweeping the expired sessions.
+        """
+        def _sweep():
+            while True:
+                time.sleep(self.sweep_interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(
+                target=_sweep, name='session-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the gauges of the store.
+
+        'live' and 'expired' count the sessions held, the latter awaiting
+        the sweeper; 'evicted_expired' and 'evicted_lru' count the
+        sessions evicted so far.
+        """
+        with self._lock:
+            now = time.time()
+            expired = 0
+            # only the part of the heap holding expired entries is walked
+            nodes = [0] if self._expiries else []
+            while nodes:
+                i = nodes.pop()
+                expiry, session_id = self._expiries[i]
+                if expiry > now:
+                    continue
+                if self._is_current(expiry, session_id):
+                    expired += 1
+                nodes.extend(j for j in (2 * i + 1, 2 * i + 2)
+                             if j < len(self._expiries))
+            return {
+                    'live': len(self._sessions) - expired,
+                    'expired': expired,
+                    'evicted_expired': self.evicted_expired,
+                    'evicted_lru': self.evicted_lru,
+                    }
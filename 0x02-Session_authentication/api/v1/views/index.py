@@ -21,8 +21,15 @@ def stats() -> str:
       - the number of each objects
     """
     from models.user import User
+    from api.v1.app import auth
     stats = {}
     stats['users'] = User.count()
+    # a shared session backend replaces the in-process sessions
+    sessions = getattr(auth, 'backend', None)
+    if sessions is None:
+        sessions = getattr(auth, 'user_id_by_session_id', None)
+    if hasattr(sessions, 'stats'):
+        stats['sessions'] = sessions.stats()
     return jsonify(stats)
 
 
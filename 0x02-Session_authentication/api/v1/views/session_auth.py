@@ -26,7 +26,6 @@ def login() -> str:
 
     # get the list of User objects matching the email
     attr = {'email': user_email}
-    user_init = User()  # init the DATA dict if not yet
     user_list = User.search(attr)
 
     if not user_list:
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+""" Model loading benchmark
+
+Times User.load_from_file on a synthetic snapshot with the JSON storage
+engine, eagerly and lazily, then the serialization of every loaded user
+as done by GET /api/v1/users. The per-record cost of parsing the two
+timestamps with strptime (as Base formerly did) and with fromisoformat
+is measured alongside. Writes machine-readable results.
+
+Usage: ./bench_load.py [--count 1000000] [--output FILE]
+"""
+from datetime import datetime
+from models.base import TIMESTAMP_FORMAT, parse_timestamp
+from models.engine import json_storage
+from models.engine.json_storage import JSONStorage, DATA
+from models.user import User
+from typing import Callable
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import uuid
+
+
+def write_snapshot(count: int):
+    """ Write a .db_User.json snapshot of count synthetic users
+    """
+    objs_json = {}
+    for i in range(count):
+        obj_id = str(uuid.UUID(int=i))
+        objs_json[obj_id] = {
+                'id': obj_id,
+                'created_at': '2023-01-01T00:00:00',
+                'updated_at': '2023-01-02T00:00:{:02d}'.format(i % 60),
+                'email': 'user{}@example.com'.format(i),
+                '_password': '{:064x}'.format(i),
+                'first_name': 'First{}'.format(i),
+                'last_name': 'Last{}'.format(i),
+                }
+    with open('.db_User.json', 'w') as f:
+        json.dump(objs_json, f)
+
+
+def timed(func: Callable) -> float:
+    """ Return the seconds taken by func()
+    """
+    gc.collect()
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    """ Parse the command line, run the benchmark and write its results
+    """
+    parser = argparse.ArgumentParser(
+            description='Benchmark loading users from the JSON storage.')
+    parser.add_argument(
+            '--count', type=int, default=1000000,
+            help='users in the snapshot (default: %(default)s)')
+    parser.add_argument(
+            '--output', default='-',
+            help='JSON results file, - for stdout (default: %(default)s)')
+    args = parser.parse_args()
+
+    storage = JSONStorage()
+    timestamps = ['2023-01-02T00:00:{:02d}'.format(i % 60)
+                  for i in range(args.count)]
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.chdir(tmp_dir)
+        write_snapshot(args.count)
+
+        json_storage.LAZY_LOAD = False
+        results['load_eager'] = timed(lambda: storage.load(User))
+        users = list(DATA['User'].values())
+        results['to_json_all'] = timed(
+                lambda: [user.to_json() for user in users])
+        del users
+
+        json_storage.LAZY_LOAD = True
+        results['load_lazy'] = timed(lambda: storage.load(User))
+        os.chdir(cwd)
+
+    results['parse_strptime'] = timed(lambda: [
+        (datetime.strptime(t, TIMESTAMP_FORMAT),
+         datetime.strptime(t, TIMESTAMP_FORMAT)) for t in timestamps])
+    results['parse_fromisoformat'] = timed(lambda: [
+        (parse_timestamp(t), parse_timestamp(t)) for t in timestamps])
+
+    for name, seconds in results.items():
+        print('{:<22}{:>10.3f} s'.format(name, seconds), file=sys.stderr)
+
+    report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'records': args.count,
+            'seconds': results,
+            }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+""" Model memory benchmark
+
+Measures the bytes held per User and UserSession object, comparing the
+slotted models with the former __dict__-based layout, and writes
+machine-readable results. The timestamps of every object are read before
+measuring, so that the slotted models, which parse them on first read,
+hold the same datetimes as the former layout.
+
+Usage: ./bench_models.py [--count 100000] [--output FILE]
+"""
+from datetime import datetime
+from models.base import TIMESTAMP_FORMAT
+from models.user import User
+from models.user_session import UserSession
+from typing import Callable, List
+import argparse
+import gc
+import json
+import platform
+import sys
+import tracemalloc
+import uuid
+
+
+class DictModel():
+    """ The former model layout: every attribute in a per-instance __dict__
+    """
+
+    fields: List[str] = []
+
+    def __init__(self, **kwargs: dict):
+        """ Initialize like Base and its subclasses did
+        """
+        self.id = kwargs.get('id', str(uuid.uuid4()))
+        self.created_at = datetime.strptime(kwargs['created_at'],
+                                            TIMESTAMP_FORMAT)
+        self.updated_at = datetime.strptime(kwargs['updated_at'],
+                                            TIMESTAMP_FORMAT)
+        for field in self.fields:
+            setattr(self, field, kwargs.get(field))
+
+    def to_json(self, for_serialization: bool = False) -> dict:
+        """ Convert the object a JSON dictionary, like Base did
+        """
+        result = {}
+        for key, value in self.__dict__.items():
+            if not for_serialization and key[0] == '_':
+                continue
+            if type(value) is datetime:
+                result[key] = value.strftime(TIMESTAMP_FORMAT)
+            else:
+                result[key] = value
+        return result
+
+
+class DictUser(DictModel):
+    """ The former User layout
+    """
+
+    fields = ['email', '_password', 'first_name', 'last_name']
+
+
+class DictUserSession(DictModel):
+    """ The former UserSession layout
+    """
+
+    fields = ['user_id', 'session_id']
+
+
+def user_record(i: int) -> dict:
+    """ Return the stored JSON of a synthetic user
+    """
+    return {
+            'id': str(uuid.UUID(int=i)),
+            'created_at': '2023-01-01T00:00:00',
+            'updated_at': '2023-01-02T00:00:00',
+            'email': 'user{}@example.com'.format(i),
+            '_password': '{:064x}'.format(i),
+            'first_name': 'First{}'.format(i),
+            'last_name': 'Last{}'.format(i),
+            }
+
+
+def session_record(i: int) -> dict:
+    """ Return the stored JSON of a synthetic user session
+    """
+    return {
+            'id': str(uuid.UUID(int=i)),
+            'created_at': '2023-01-01T00:00:00',
+            'updated_at': '2023-01-02T00:00:00',
+            'user_id': str(uuid.UUID(int=i + 1)),
+            'session_id': str(uuid.UUID(int=i + 2)),
+            }
+
+
+def models() -> dict:
+    """ Return the benchmarked models by name, as (build, record) pairs
+    """
+    return {
+            'User': (lambda r: User(**r), user_record),
+            'User (dict)': (lambda r: DictUser(**r), user_record),
+            'UserSession': (lambda r: UserSession(**r), session_record),
+            'UserSession (dict)': (lambda r: DictUserSession(**r),
+                                   session_record),
+            }
+
+
+def bytes_per_object(build: Callable, records: List[dict]) -> float:
+    """ Return the mean memory, in bytes, held by one object built by build
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objs = [build(record) for record in records]
+        for obj in objs:
+            # parsed now by the slotted models, as the former layout did
+            obj.created_at, obj.updated_at
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    # the list holding the objects is not part of them
+    held -= sys.getsizeof(objs)
+    return held / len(objs)
+
+
+def main():
+    """ Parse the command line, run the benchmark and write its results
+    """
+    parser = argparse.ArgumentParser(
+            description='Benchmark the memory used by model objects.')
+    parser.add_argument(
+            '--count', type=int, default=100000,
+            help='objects built per model (default: %(default)s)')
+    parser.add_argument(
+            '--output', default='-',
+            help='JSON results file, - for stdout (default: %(default)s)')
+    args = parser.parse_args()
+
+    results = []
+    for name, (build, record) in models().items():
+        records = [record(i) for i in range(args.count)]
+        if build(records[0]).to_json(True) != records[0]:
+            sys.exit('{}: to_json differs from the stored JSON'.format(name))
+        size = bytes_per_object(build, records)
+        results.append({'model': name, 'objects': args.count,
+                        'bytes_per_object': size})
+        print('{:<20}{:>10.0f} B/object'.format(name, size), file=sys.stderr)
+
+    report = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+            }
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
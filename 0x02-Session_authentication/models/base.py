@@ -2,38 +2,120 @@
 """ Base module
 """
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
-import json
+from typing import TypeVar, List, Iterable, Dict
+import os
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
-DATA = {}
+
+# engine storing the objects: 'json' (files, all objects held in memory)
+# or 'sqlite' (database, objects read on demand)
+STORAGE_ENGINE = os.getenv('BASE_STORAGE_ENGINE', 'json')
+if STORAGE_ENGINE == 'sqlite':
+    from models.engine.sqlite_storage import SQLiteStorage
+    storage = SQLiteStorage()
+else:
+    from models.engine.json_storage import JSONStorage
+    storage = JSONStorage()
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+
+    fromisoformat reads this format many times faster than strptime,
+    which remains for the strings only strptime accepts.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def format_timestamp(value: datetime) -> str:
+    """ Format a datetime as TIMESTAMP_FORMAT
+    """
+    if value.tzinfo is None and value.year >= 1000:
+        # same output as strftime, many times faster
+        return value.isoformat(timespec='seconds')
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+class Timestamp():
+    """ Datetime attribute that may hold its serialized string
+
+    The string an object is loaded with is only parsed when the
+    attribute is first read, and serialized as is if it never is.
+    """
+
+    def __init__(self, slot: str):
+        """ Initialize the attribute, stored in the given slot
+        """
+        self.slot = slot
+
+    def __get__(self, obj: TypeVar('Base'), owner: type = None) -> datetime:
+        """ Return the datetime, parsing it if needed
+        """
+        if obj is None:
+            return self
+        value = getattr(obj, self.slot)
+        if type(value) is str:
+            value = parse_timestamp(value)
+            # same value: the cached JSON of the object stays valid
+            object.__setattr__(obj, self.slot, value)
+        return value
+
+    def __set__(self, obj: TypeVar('Base'), value: datetime):
+        """ Set the datetime, or its TIMESTAMP_FORMAT string
+        """
+        setattr(obj, self.slot, value)
 
 
 class Base():
     """ Base class
     """
 
+    # attributes that search looks up through an index, mapped to
+    # whether their value must be unique among saved objects
+    indexed_attributes: Dict[str, bool] = {}
+
+    # instances hold their attributes in slots instead of a __dict__;
+    # subclasses declare their own attributes the same way
+    __slots__ = ('id', '_created_at', '_updated_at', '_json_cache')
+    created_at = Timestamp('_created_at')
+    updated_at = Timestamp('_updated_at')
+    # attributes of the instances in serialization order, mapped to the
+    # slot holding their value
+    _fields = {'id': 'id', 'created_at': '_created_at',
+               'updated_at': '_updated_at'}
+
+    def __init_subclass__(cls, **kwargs: dict):
+        """ Add the slots of a subclass to its attributes
+        """
+        super().__init_subclass__(**kwargs)
+        cls._fields = dict(cls.__mro__[1]._fields)
+        for k in cls.__dict__.get('__slots__', ()):
+            cls._fields[k] = k
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
         self.id = kwargs.get('id', str(uuid.uuid4()))
+        # timestamp strings are parsed on first read (see Timestamp)
         if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+            self._created_at = kwargs.get('created_at')
         else:
-            self.created_at = datetime.utcnow()
+            self._created_at = datetime.utcnow()
         if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self._updated_at = kwargs.get('updated_at')
         else:
-            self.updated_at = datetime.utcnow()
+            self._updated_at = datetime.utcnow()
+
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, dropping the cached JSON of the object
+        """
+        object.__setattr__(self, name, value)
+        object.__setattr__(self, '_json_cache', None)
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,69 +126,90 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def _items(self) -> Iterable[tuple]:
+        """ Iterate over the (name, value) of the attributes that are set
+
+        Timestamps not read yet are given as their string.
+        """
+        for key, slot in self._fields.items():
+            try:
+                value = getattr(self, slot)
+            except AttributeError:
+                continue
+            yield key, value
+        # subclasses without slots keep their other attributes in __dict__
+        yield from getattr(self, '__dict__', {}).items()
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
+
+        The result is cached until an attribute of the object is set.
         """
-        result = {}
-        for key, value in self.__dict__.items():
-            if not for_serialization and key[0] == '_':
-                continue
-            if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
-            else:
-                result[key] = value
-        return result
+        cache = getattr(self, '_json_cache', None)
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, '_json_cache', cache)
+        result = cache.get(for_serialization)
+        if result is None:
+            result = {}
+            for key, value in self._items():
+                if not for_serialization and key[0] == '_':
+                    continue
+                if type(value) is datetime:
+                    result[key] = format_timestamp(value)
+                else:
+                    result[key] = value
+            cache[for_serialization] = result
+        # callers may change their copy
+        return dict(result)
 
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        storage.load(cls)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
-
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+        storage.save_all(cls)
 
     def save(self):
         """ Save current object
         """
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage.save(self)
 
     def remove(self):
         """ Remove object
         """
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage.remove(self)
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Save objects of the class at once, persisting them once
+
+        Raises ValueError, saving none of them, if a unique value would
+        be held by two objects.
+        """
+        objs = list(objs)
+        now = datetime.utcnow()
+        for obj in objs:
+            obj.updated_at = now
+        storage.save_many(cls, objs)
+
+    @classmethod
+    def remove_many(cls, objs: Iterable[TypeVar('Base')]):
+        """ Remove objects of the class at once, persisting once
+        """
+        storage.remove_many(cls, list(objs))
 
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+        return storage.count(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar('Base')]:
@@ -114,25 +217,32 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def version(cls) -> int:
+        """ Return a number that changes whenever an object is saved or
+        removed, by any process
+        """
+        return storage.version(cls)
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage.get(cls, id)
+
+    @classmethod
+    def page(
+            cls,
+            after: str = None,
+            limit: int = None
+            ) -> List[TypeVar('Base')]:
+        """ Return objects in ID order: the first ones after the ID after,
+        limit at most
+        """
+        return storage.page(cls, after, limit)
 
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
         """
-        s_class = cls.__name__
-        # print('in models/base...', attributes, DATA)  # SCAFF
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if (getattr(obj, k) != v):
-                    return False
-            return True
-
-        return list(filter(_search, DATA[s_class].values()))
+        return storage.search(cls, attributes)
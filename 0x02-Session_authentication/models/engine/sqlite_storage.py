@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+""" SQLite storage engine module
+"""
+from models.engine.storage import Storage
+from typing import TypeVar, List
+import json
+import os
+import sqlite3
+import threading
+
+
+SQLITE_PATH = os.getenv('BASE_SQLITE_PATH', '.db.sqlite3')
+# value types SQLite compares like Python does
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def _quote(name: str) -> str:
+    """ Quote a table or column name for SQL
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _duplicates_query(table: str, k: str) -> str:
+    """ Return the SQL listing the duplicated values of a column
+    """
+    return "SELECT {0}, COUNT(*) FROM {1} GROUP BY {0} HAVING COUNT(*) > 1"\
+        .format(_quote(k), table)
+
+
+class SQLiteStorage(Storage):
+    """ Stores the objects in a SQLite database, one table per class
+
+    Each row holds the object ID, its JSON serialization, and a column
+    per indexed attribute of the class. The _versions table counts the
+    writes to each class. Nothing is kept in memory:
+    objects are built from their row when get or search returns them,
+    and search filters are applied by SQL as far as possible.
+    """
+
+    def __init__(self, db_path: str = SQLITE_PATH):
+        """ Initialize the engine on the database file db_path
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tables = {}
+        self._tables_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Return the database connection of the calling thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # autocommit: transactions are opened explicitly by writes
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   isolation_level=None)
+            # readers no longer wait for writers, nor writers for readers
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _table(self, cls: type) -> str:
+        """ Return the quoted table name of a class, creating the table
+
+        Columns and indexes missing for indexed attributes are added,
+        the columns being filled from the stored objects.
+        """
+        s_class = cls.__name__
+        table = self._tables.get(s_class)
+        if table is not None:
+            return table
+
+        with self._tables_lock:
+            table = _quote(s_class)
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("CREATE TABLE IF NOT EXISTS {} "
+                             "(id TEXT PRIMARY KEY, data TEXT NOT NULL)"
+                             .format(table))
+                conn.execute("CREATE TABLE IF NOT EXISTS _versions "
+                             "(class TEXT PRIMARY KEY, version INTEGER)")
+                conn.execute("INSERT OR IGNORE INTO _versions VALUES (?, 0)",
+                             (s_class,))
+                columns = [row[1] for row in conn.execute(
+                    "PRAGMA table_info({})".format(table))]
+                for k, unique in cls.indexed_attributes.items():
+                    if k not in columns:
+                        conn.execute("ALTER TABLE {} ADD COLUMN {}".format(
+                            table, _quote(k)))
+                        conn.execute("UPDATE {} SET {} = json_extract("
+                                     "data, ?)".format(table, _quote(k)),
+                                     ('$.' + k,))
+                    try:
+                        conn.execute("CREATE {}INDEX IF NOT EXISTS {} ON {} "
+                                     "({})".format("UNIQUE " if unique else "",
+                                                   _quote(s_class + '_' + k),
+                                                   table, _quote(k)))
+                    except sqlite3.IntegrityError:
+                        # rows stored before the attribute became unique
+                        raise ValueError(
+                                "{}.{} must be unique, but the database "
+                                "holds duplicates; give them distinct "
+                                "values or remove them (see {})".format(
+                                    s_class, k, _duplicates_query(table, k)))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._tables[s_class] = table
+        return table
+
+    @staticmethod
+    def _build(cls: type, data: str) -> TypeVar('Base'):
+        """ Build an object from its stored JSON
+        """
+        return cls(**json.loads(data))
+
+    def load(self, cls: type):
+        """ Prepare the table of a class; objects are read on demand
+        """
+        self._table(cls)
+
+    def save_all(self, cls: type):
+        """ Nothing to do: every save is already in the database
+        """
+        self._table(cls)
+
+    def save(self, obj: TypeVar('Base')):
+        """ Insert or update one object
+
+        Raises ValueError if a unique value is already held by another
+        object.
+        """
+        self.save_many(obj.__class__, [obj])
+
+    def save_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Insert or update objects of a class, in one transaction
+
+        Raises ValueError, saving none of the objects, if a unique value
+        is already held by another object.
+        """
+        if not objs:
+            return
+        table = self._table(cls)
+        columns = [_quote(k) for k in cls.indexed_attributes]
+        upsert = ("INSERT INTO {} (id, data{}) VALUES (?, ?{}) "
+                  "ON CONFLICT(id) DO UPDATE SET data = excluded.data{}"
+                  .format(table,
+                          "".join(", " + c for c in columns),
+                          ", ?" * len(columns),
+                          "".join(", {0} = excluded.{0}".format(c)
+                                  for c in columns)))
+        uniques = [k for k, unique in cls.indexed_attributes.items()
+                   if unique]
+        obj_ids = {obj.id for obj in objs}
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for k in uniques:
+                holders = {}
+                for obj in objs:
+                    v = getattr(obj, k, None)
+                    if v is None:
+                        continue
+                    if holders.setdefault(v, obj.id) != obj.id:
+                        raise ValueError("{} {} already exists".format(k, v))
+                    # objects of the batch get their new values anyway
+                    for row in conn.execute("SELECT id FROM {} WHERE {} = ?"
+                                            .format(table, _quote(k)), (v,)):
+                        if row[0] not in obj_ids:
+                            raise ValueError("{} {} already exists".format(
+                                k, v))
+            if uniques:
+                # free the unique values of the batch, which may swap them
+                conn.executemany("UPDATE {} SET {} WHERE id = ?".format(
+                    table, ", ".join(_quote(k) + " = NULL" for k in uniques)),
+                    [(obj_id,) for obj_id in obj_ids])
+            for obj in objs:
+                values = [getattr(obj, k, None)
+                          for k in cls.indexed_attributes]
+                conn.execute(upsert,
+                             [obj.id, json.dumps(obj.to_json(True))] + values)
+            self._changed(conn, cls)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete one object
+        """
+        self.remove_many(obj.__class__, [obj])
+
+    def remove_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Delete objects of a class, in one transaction
+        """
+        table = self._table(cls)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.executemany(
+                    "DELETE FROM {} WHERE id = ?".format(table),
+                    [(obj.id,) for obj in objs])
+            if cursor.rowcount > 0:
+                self._changed(conn, cls)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _changed(conn: sqlite3.Connection, cls: type):
+        """ Increment the version of a class, in the current transaction
+        """
+        conn.execute("UPDATE _versions SET version = version + 1 "
+                     "WHERE class = ?", (cls.__name__,))
+
+    def version(self, cls: type) -> int:
+        """ Return the version of the objects of a class
+        """
+        self._table(cls)
+        return self._connection().execute(
+                "SELECT version FROM _versions WHERE class = ?",
+                (cls.__name__,)).fetchone()[0]
+
+    def count(self, cls: type) -> int:
+        """ Count all objects of a class
+        """
+        table = self._table(cls)
+        return self._connection().execute(
+                "SELECT COUNT(*) FROM {}".format(table)).fetchone()[0]
+
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object by ID
+        """
+        table = self._table(cls)
+        row = self._connection().execute(
+                "SELECT data FROM {} WHERE id = ?".format(table),
+                (id,)).fetchone()
+        if row is None:
+            return None
+        return self._build(cls, row[0])
+
+    def page(
+            self,
+            cls: type,
+            after: str = None,
+            limit: int = None
+            ) -> List[TypeVar('Base')]:
+        """ Return the objects of a class in ID order, from the first one
+        after the ID after, limit at most
+        """
+        table = self._table(cls)
+        # the primary key index gives the order
+        rows = self._connection().execute(
+                "SELECT data FROM {} WHERE id > ? ORDER BY id LIMIT ?".format(
+                    table), (after or "", -1 if limit is None else limit))
+        return [self._build(cls, row[0]) for row in rows]
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Search all objects with matching attributes
+
+        Indexed attributes are matched against their column, other plain
+        attributes against the stored JSON. The rows found are checked
+        again on the objects, which keeps Python's comparison rules.
+        """
+        table = self._table(cls)
+        clauses = []
+        params = []
+        for k, v in attributes.items():
+            if type(v) not in SCALAR_TYPES:
+                continue
+            if k in cls.indexed_attributes:
+                clauses.append("{} IS ?".format(_quote(k)))
+            elif k in cls._fields or not hasattr(cls, k):
+                # a slot, or an attribute set on the object: stored as is
+                clauses.append("json_extract(data, ?) IS ?")
+                params.append('$.' + k)
+            else:
+                continue
+            params.append(v)
+
+        query = "SELECT data FROM {}".format(table)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+
+        def _search(obj):
+            for k, v in attributes.items():
+                if (getattr(obj, k) != v):
+                    return False
+            return True
+
+        objs = (self._build(cls, row[0])
+                for row in self._connection().execute(query, params))
+        return list(filter(_search, objs))
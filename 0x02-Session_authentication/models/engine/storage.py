@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+""" Storage engine interface module
+"""
+from abc import ABC, abstractmethod
+from typing import TypeVar, List
+
+
+class Storage(ABC):
+    """ Interface of the storage engines behind Base
+
+    Every method takes the model class it works on (or an instance of
+    it), so that one engine serves all the models. An engine missing one
+    of them can't be instantiated.
+    """
+
+    @abstractmethod
+    def load(self, cls: type):
+        """ Load, or prepare access to, the objects of a class
+        """
+
+    @abstractmethod
+    def save_all(self, cls: type):
+        """ Persist every object of a class
+        """
+
+    @abstractmethod
+    def save(self, obj: TypeVar('Base')):
+        """ Persist one object
+        """
+
+    @abstractmethod
+    def save_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Persist objects of a class at once, or none of them on error
+        """
+
+    @abstractmethod
+    def remove(self, obj: TypeVar('Base')):
+        """ Delete one object
+        """
+
+    @abstractmethod
+    def remove_many(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Delete objects of a class at once
+        """
+
+    @abstractmethod
+    def count(self, cls: type) -> int:
+        """ Count the objects of a class
+        """
+
+    @abstractmethod
+    def version(self, cls: type) -> int:
+        """ Return the version of the objects of a class, changed by every
+        save or removal
+        """
+
+    @abstractmethod
+    def get(self, cls: type, id: str) -> TypeVar('Base'):
+        """ Return one object of a class by ID, or None
+        """
+
+    @abstractmethod
+    def page(
+            self,
+            cls: type,
+            after: str = None,
+            limit: int = None
+            ) -> List[TypeVar('Base')]:
+        """ Return the objects of a class in ID order, from the first one
+        after the ID after, limit at most
+        """
+
+    @abstractmethod
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Return the objects of a class with matching attributes
+        """
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+""" Password hashers module
+"""
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+import base64
+import hashlib
+import hmac
+import os
+
+
+# hasher of new passwords: 'pbkdf2_sha256' or 'scrypt'
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2_sha256')
+PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', '600000'))
+SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', '16384'))
+SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', '8'))
+SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', '1'))
+# hashes computed at once; hashlib releases the GIL while hashing
+HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '0')) or None
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS,
+                               thread_name_prefix='password')
+
+
+def _b64encode(data: bytes) -> str:
+    """ Encode bytes in base64, without padding
+    """
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(data: str) -> bytes:
+    """ Decode base64 without padding
+    """
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+
+class Hasher(ABC):
+    """ Hashes passwords into strings holding the hasher name and
+    parameters, so that hashes made under other settings still verify
+    """
+
+    name = None
+
+    @abstractmethod
+    def encode(self, password: str) -> str:
+        """ Return the hash string of a password, freshly salted
+        """
+
+    @abstractmethod
+    def verify(self, password: str, encoded: str) -> bool:
+        """ Check a password against one of the hash strings of this hasher
+        """
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """ Check if a hash string is weaker than this hasher's settings
+        """
+        return False
+
+
+class PBKDF2Hasher(Hasher):
+    """ PBKDF2-HMAC-SHA256: pbkdf2_sha256$<iterations>$<salt>$<hash>
+    """
+
+    name = 'pbkdf2_sha256'
+
+    def __init__(self, iterations: int = PBKDF2_ITERATIONS):
+        """ Initialize a hasher of the given cost
+        """
+        self.iterations = iterations
+
+    @staticmethod
+    def _hash(password: str, salt: bytes, iterations: int) -> bytes:
+        """ Return the raw hash of a password
+        """
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt,
+                                   iterations)
+
+    def encode(self, password: str) -> str:
+        """ Return the hash string of a password, freshly salted
+        """
+        salt = os.urandom(16)
+        digest = self._hash(password, salt, self.iterations)
+        return '$'.join((self.name, str(self.iterations), _b64encode(salt),
+                         _b64encode(digest)))
+
+    def verify(self, password: str, encoded: str) -> bool:
+        """ Check a password against one of the hash strings of this hasher
+        """
+        _, iterations, salt, digest = encoded.split('$')
+        return hmac.compare_digest(
+                self._hash(password, _b64decode(salt), int(iterations)),
+                _b64decode(digest))
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """ Check if a hash string is weaker than this hasher's settings
+        """
+        return int(encoded.split('$')[1]) < self.iterations
+
+
+class ScryptHasher(Hasher):
+    """ scrypt: scrypt$<n>$<r>$<p>$<salt>$<hash>
+    """
+
+    name = 'scrypt'
+
+    def __init__(self, n: int = SCRYPT_N, r: int = SCRYPT_R,
+                 p: int = SCRYPT_P):
+        """ Initialize a hasher of the given cost
+        """
+        self.n = n
+        self.r = r
+        self.p = p
+
+    @staticmethod
+    def _hash(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+        """ Return the raw hash of a password
+        """
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    def encode(self, password: str) -> str:
+        """ Return the hash string of a password, freshly salted
+        """
+        salt = os.urandom(16)
+        digest = self._hash(password, salt, self.n, self.r, self.p)
+        return '$'.join((self.name, str(self.n), str(self.r), str(self.p),
+                         _b64encode(salt), _b64encode(digest)))
+
+    def verify(self, password: str, encoded: str) -> bool:
+        """ Check a password against one of the hash strings of this hasher
+        """
+        _, n, r, p, salt, digest = encoded.split('$')
+        return hmac.compare_digest(
+                self._hash(password, _b64decode(salt), int(n), int(r),
+                           int(p)),
+                _b64decode(digest))
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """ Check if a hash string is weaker than this hasher's settings
+        """
+        _, n, r, p = encoded.split('$')[:4]
+        return (int(n), int(r), int(p)) < (self.n, self.r, self.p)
+
+
+class SHA256Hasher(Hasher):
+    """ Legacy unsalted SHA-256 hex digests, only verified
+    """
+
+    name = 'sha256'
+
+    def encode(self, password: str) -> str:
+        """ Refuse to make new legacy hashes: they are unsalted and fast
+        to crack, and only kept so that stored ones verify until rehashed
+
+        Raises ValueError.
+        """
+        raise ValueError("sha256 hashes can't be made, only verified")
+
+    def verify(self, password: str, encoded: str) -> bool:
+        """ Check a password against a legacy hash
+        """
+        return hmac.compare_digest(
+                hashlib.sha256(password.encode()).hexdigest().lower(),
+                encoded)
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """ Legacy hashes always need to be replaced
+        """
+        return True
+
+
+HASHERS: Dict[str, Hasher] = {
+        hasher.name: hasher
+        for hasher in (PBKDF2Hasher(), ScryptHasher(), SHA256Hasher())
+        }
+
+# the legacy hasher only verifies, new passwords can't be hashed with it
+if PASSWORD_HASHER not in (PBKDF2Hasher.name, ScryptHasher.name):
+    raise ValueError("PASSWORD_HASHER must be '{}' or '{}', not '{}'".format(
+        PBKDF2Hasher.name, ScryptHasher.name, PASSWORD_HASHER))
+
+
+def identify(encoded: str) -> Hasher:
+    """ Return the hasher of a hash string, or None if unknown
+    """
+    if '$' not in encoded:
+        return HASHERS['sha256'] if len(encoded) == 64 else None
+    return HASHERS.get(encoded.split('$')[0])
+
+
+def hash_password(password: str) -> str:
+    """ Return the hash string of a password, using PASSWORD_HASHER
+    """
+    return _executor.submit(HASHERS[PASSWORD_HASHER].encode, password).result()
+
+
+def hash_passwords(passwords: Iterable[str]) -> List[str]:
+    """ Return the hash strings of passwords, in order, using
+    PASSWORD_HASHER
+
+    The passwords are hashed in parallel, up to PASSWORD_HASH_WORKERS at
+    once, instead of one after the other.
+    """
+    return list(_executor.map(HASHERS[PASSWORD_HASHER].encode, passwords))
+
+
+def verify_password(password: str, encoded: str) -> Tuple[bool, str]:
+    """ Check a password against a hash string
+
+    Return whether the password is valid, and a new hash string to store
+    in place of encoded when it was made by another hasher or with a
+    lower cost than the current settings (None otherwise).
+    """
+    hasher = identify(encoded)
+    if hasher is None:
+        return (False, None)
+    try:
+        valid = _executor.submit(hasher.verify, password, encoded).result()
+    except ValueError:
+        # malformed hash string
+        return (False, None)
+    if not valid:
+        return (False, None)
+    if hasher.name != PASSWORD_HASHER or\
+            HASHERS[PASSWORD_HASHER].needs_rehash(encoded):
+        return (True, hash_password(password))
+    return (True, None)
@@ -12,6 +12,10 @@ import uuid
 class UserSession(Base):
     """ UserSession class.
     """
+
+    indexed_attributes = {'session_id': True, 'user_id': False}
+    __slots__ = ('user_id', 'session_id')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a UserSession instance.
         """